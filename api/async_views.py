@@ -0,0 +1,37 @@
+import asyncio
+
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    # DRF only dispatches to sync handlers. This mirrors APIView.dispatch so that
+    # async handlers run on the event loop under ASGI; blocking work inside them
+    # has to go through sync_to_async.
+
+    # The default authenticators load the session user synchronously. These
+    # endpoints are public, so requests are not authenticated at all.
+    authentication_classes = []
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
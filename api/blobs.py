@@ -0,0 +1,91 @@
+import hashlib
+import uuid
+from typing import IO, Optional
+
+from django.db import connection, transaction
+
+from api.models import Image, ImageBlob
+from api.uploads import probe_image_size
+
+BLOB_FIELDS = ("id", "name", "width", "height", "refcount")
+
+ACQUIRE_SQL = """
+UPDATE {table} SET refcount = refcount + 1, updated_at = now()
+WHERE sha256 = %s
+RETURNING {fields}
+"""
+
+INSERT_SQL = """
+INSERT INTO {table} (
+    id, sha256, name, width, height, refcount,
+    is_active, is_deleted, created_at, updated_at
+)
+VALUES (%s, %s, %s, %s, %s, 1, true, false, now(), now())
+ON CONFLICT (sha256) DO UPDATE SET refcount = {table}.refcount + 1
+RETURNING {fields}
+"""
+
+RELEASE_SQL = """
+UPDATE {table} SET refcount = refcount - 1, updated_at = now()
+WHERE id = %s
+RETURNING refcount, name
+"""
+
+
+def file_sha256(file: IO[bytes]) -> str:
+    # HashingUploadHandler hashes uploads while they stream in; anything else is
+    # hashed here.
+    digest = getattr(file, "sha256", None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        file.seek(0)
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        file.seek(0)
+        digest = file.sha256 = hasher.hexdigest()
+    return digest
+
+
+def blob_exists(file: IO[bytes]) -> bool:
+    return ImageBlob.objects.filter(sha256=file_sha256(file)).exists()
+
+
+def _fetch(sql: str, params: list) -> Optional[ImageBlob]:
+    table = ImageBlob._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(table=table, fields=", ".join(BLOB_FIELDS)), params)
+        row = cursor.fetchone()
+    return ImageBlob(**dict(zip(BLOB_FIELDS, row))) if row else None
+
+
+@transaction.atomic
+def acquire_blob(file: IO[bytes]) -> ImageBlob:
+    digest = file_sha256(file)
+    blob = _fetch(ACQUIRE_SQL, [digest])
+    if blob is not None:
+        blob.sha256 = digest
+        return blob
+
+    width, height = probe_image_size(file)
+    # Blobs are addressed by their hash in the table; the file keeps the name of
+    # its first upload.
+    field = Image._meta.get_field("image")
+    name = field.storage.save(field.generate_filename(None, file.name), file)
+    blob = _fetch(INSERT_SQL, [uuid.uuid4(), digest, name, width, height])
+    blob.sha256 = digest
+    if blob.name != name:
+        # A concurrent upload of the same bytes stored its copy first.
+        field.storage.delete(name)
+    return blob
+
+
+def release_blob(pk: uuid.UUID) -> Optional[str]:
+    # Returns the storage name once the last image referencing it is gone.
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_SQL.format(table=ImageBlob._meta.db_table), [pk])
+            refcount, name = cursor.fetchone()
+        if refcount:
+            return None
+        ImageBlob.objects.filter(pk=pk, refcount=0).delete()
+    return name
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+from collections import defaultdict, deque
+from typing import Optional
+from uuid import UUID
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Value, When
+from rest_framework import serializers
+
+from api.cache import invalidate_trees
+from api.models import Annotation
+from api.trees import AnnotationTree
+from api.type_defs import AnnotationFlatDict
+
+ROOTS_LOCK_KEY = 0x616E6E6F
+
+
+def topological_order(items: list[AnnotationFlatDict]) -> list[AnnotationFlatDict]:
+    children: dict[Optional[str], list[AnnotationFlatDict]] = defaultdict(list)
+    ids = set()
+    for item in items:
+        if item["id"] in ids:
+            raise serializers.ValidationError(
+                {"id": [f"Duplicate annotation id {item['id']}."]}
+            )
+        ids.add(item["id"])
+    for item in items:
+        parent = item.get("parent")
+        children[parent if parent in ids else None].append(item)
+
+    ordered: list[AnnotationFlatDict] = []
+    queue = deque(children[None])
+    while queue:
+        item = queue.popleft()
+        ordered.append(item)
+        queue.extend(children[item["id"]])
+    if len(ordered) != len(items):
+        raise serializers.ValidationError(
+            {"parent": ["Annotation relations must not contain cycles."]}
+        )
+    return ordered
+
+
+def lock_roots() -> None:
+    # Root nodes have no parent row to lock, so appends at the root level are
+    # serialized with a transaction-scoped advisory lock instead.
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [ROOTS_LOCK_KEY])
+
+
+def _last_children(parents: list[Annotation]) -> dict[str, Annotation]:
+    query = Q()
+    for parent in parents:
+        if not parent.is_leaf():
+            query |= Q(
+                depth=parent.depth + 1,
+                path__range=Annotation._get_children_path_interval(parent.path),
+            )
+    last: dict[str, Annotation] = {}
+    if query:
+        for child in Annotation.objects.filter(query).only("path"):
+            parent_path = Annotation._get_parent_path_from_path(child.path)
+            if parent_path not in last or last[parent_path].path < child.path:
+                last[parent_path] = child
+    return last
+
+
+def path_overflow(parent_path: str) -> serializers.ValidationError:
+    return serializers.ValidationError(
+        {"parent": [f"No room for more annotations under path '{parent_path}'."]}
+    )
+
+
+def _check_path(path: str, step: int, parent_path: str) -> None:
+    if len(path) > Annotation._meta.get_field("path").max_length or (
+        step >= len(Annotation.alphabet) ** Annotation.steplen
+    ):
+        raise path_overflow(parent_path)
+
+
+def build_nodes(
+    ordered: list[AnnotationFlatDict],
+    groups: dict[Optional[str], list[AnnotationFlatDict]],
+    parents: dict[UUID, Annotation],
+    last: dict[str, Annotation],
+) -> dict[str, Annotation]:
+    nodes: dict[str, Annotation] = {}
+    for key in [None, *parents, *(item["id"] for item in ordered)]:
+        if key not in groups:
+            continue
+        parent = nodes.get(key) or parents.get(key)
+        parent_path = parent.path if parent else ""
+        sibling = last.get(parent_path)
+        step = sibling._get_lastpos_in_path() + 1 if sibling else 1
+        depth = parent.depth + 1 if parent else 1
+        for offset, item in enumerate(groups[key]):
+            fields = {k: v for k, v in item.items() if k != "parent"}
+            if parent:
+                fields.pop("image", None)
+                fields["image_id"] = parent.image_id
+            node = Annotation(
+                path=Annotation._get_path(parent_path, depth, step + offset),
+                depth=depth,
+                numchild=len(groups.get(item["id"], [])),
+                **fields,
+            )
+            _check_path(node.path, step + offset, parent_path)
+            nodes[item["id"]] = node
+    return nodes
+
+
+@transaction.atomic
+def bulk_create_forest(
+    items: list[AnnotationFlatDict],
+) -> tuple[list[Annotation], AnnotationTree]:
+    ordered = topological_order(items)
+    new_ids = {item["id"] for item in ordered}
+    parent_ids = {
+        item["parent"]
+        for item in ordered
+        if item.get("parent") and item["parent"] not in new_ids
+    }
+    parents = {
+        parent.pk: parent
+        for parent in Annotation.objects.select_for_update().filter(pk__in=parent_ids)
+    }
+    missing = parent_ids - parents.keys()
+    if missing:
+        raise serializers.ValidationError(
+            {"parent": [f"Annotation {pk} does not exist." for pk in missing]}
+        )
+
+    groups: dict[Optional[str], list[AnnotationFlatDict]] = defaultdict(list)
+    for item in ordered:
+        groups[item.get("parent")].append(item)
+
+    last = _last_children(list(parents.values()))
+    if None in groups:
+        lock_roots()
+        last_root = Annotation.get_last_root_node()
+        if last_root:
+            last[""] = last_root
+
+    nodes = build_nodes(ordered, groups, parents, last)
+    Annotation.objects.bulk_create([nodes[item["id"]] for item in ordered])
+    if parents:
+        Annotation.objects.filter(pk__in=parents).update(
+            numchild=F("numchild")
+            + Case(*[When(pk=pk, then=Value(len(groups[pk]))) for pk in parents])
+        )
+    for pk, parent in parents.items():
+        parent.numchild += len(groups[pk])
+    return [nodes[item["id"]] for item in items], AnnotationTree(
+        [*parents.values(), *nodes.values()]
+    )
+
+
+# Each target scans its subtree as a byte-wise range over the path pattern
+# index; '~' sorts after every character of the path alphabet.
+MOVE_SQL = """
+UPDATE {table} SET path = moved.path, depth = length(moved.path) / %s,
+    image_id = moved.image_id
+FROM (
+    SELECT DISTINCT ON (node.id) node.id,
+        target.path || substr(node.path, length(target.old_path) + 1) AS path,
+        target.image_id
+    FROM (VALUES {values}) AS target (old_path, path, image_id)
+    CROSS JOIN LATERAL (
+        SELECT id, path FROM {table}
+        WHERE path ~>=~ target.old_path AND path ~<~ (target.old_path || '~')
+    ) node
+    ORDER BY node.id, length(target.old_path) DESC
+) moved
+WHERE {table}.id = moved.id
+"""
+
+
+@transaction.atomic
+def bulk_move(moves: list[tuple[UUID, Optional[UUID]]]) -> list[Annotation]:
+    moved_ids = [pk for pk, _ in moves]
+    if len(set(moved_ids)) != len(moved_ids):
+        raise serializers.ValidationError(
+            {"id": ["Each annotation can only be moved once."]}
+        )
+    nodes = {
+        node.pk: node
+        for node in Annotation.objects.live()
+        .select_for_update(of=("self",))
+        .filter(pk__in={*moved_ids, *(pk for _, pk in moves if pk)})
+        .order_by("path")
+    }
+    missing = {*moved_ids, *(pk for _, pk in moves if pk)} - nodes.keys()
+    if missing:
+        raise serializers.ValidationError(
+            {"id": [f"Annotation {pk} does not exist." for pk in missing]}
+        )
+
+    targets = {
+        pk: nodes[parent] if parent else None
+        for pk, parent in moves
+        if Annotation._get_parent_path_from_path(nodes[pk].path)
+        != (nodes[parent].path if parent else "")
+    }
+    if not targets:
+        return []
+    moved = {nodes[pk].path: nodes[pk] for pk in targets}
+    old_parents = {
+        parent.path: parent
+        for parent in Annotation.objects.select_for_update()
+        .filter(path__in={Annotation._get_parent_path_from_path(p) for p in moved})
+        .only("id", "path")
+    }
+
+    parents = [target for target in targets.values() if target]
+    last = _last_children(parents)
+    if None in targets.values():
+        lock_roots()
+        last_root = Annotation.get_last_root_node()
+        if last_root:
+            last[""] = last_root
+    next_step = {
+        path: last[path]._get_lastpos_in_path() + 1 if path in last else 1
+        for path in {*(parent.path for parent in parents), ""}
+    }
+
+    final: dict[str, tuple[str, Optional[UUID]]] = {}
+    resolving: set[str] = set()
+
+    def moved_ancestor(path: str) -> Optional[Annotation]:
+        for end in range(len(path), 0, -Annotation.steplen):
+            if path[:end] in moved:
+                return moved[path[:end]]
+        return None
+
+    def resolve(node: Annotation) -> tuple[str, Optional[UUID]]:
+        ancestor = moved_ancestor(node.path)
+        if ancestor is None:
+            return node.path, node.image_id
+        path, image_id = resolve_moved(ancestor)
+        return path + node.path[len(ancestor.path) :], image_id
+
+    def resolve_moved(node: Annotation) -> tuple[str, Optional[UUID]]:
+        if node.path in final:
+            return final[node.path]
+        if node.path in resolving:
+            raise serializers.ValidationError(
+                {"parent": ["Annotation relations must not contain cycles."]}
+            )
+        resolving.add(node.path)
+        target = targets[node.pk]
+        parent_path, image_id = resolve(target) if target else ("", node.image_id)
+        key = target.path if target else ""
+        step = next_step[key]
+        next_step[key] += 1
+        path = Annotation._get_path(
+            parent_path, len(parent_path) // Annotation.steplen + 1, step
+        )
+        _check_path(path, step, parent_path)
+        final[node.path] = path, image_id
+        return final[node.path]
+
+    for node in moved.values():
+        resolve_moved(node)
+
+    invalidate_trees([*moved, *(parent.path for parent in parents)])
+    numchild: dict[UUID, int] = defaultdict(int)
+    for path, node in moved.items():
+        old_parent = old_parents.get(Annotation._get_parent_path_from_path(path))
+        if old_parent:
+            numchild[old_parent.pk] -= 1
+        if targets[node.pk]:
+            numchild[targets[node.pk].pk] += 1
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            MOVE_SQL.format(
+                table=Annotation._meta.db_table,
+                values=", ".join(["(%s, %s, %s::uuid)"] * len(final)),
+            ),
+            [
+                Annotation.steplen,
+                *(
+                    value
+                    for old, (new, image_id) in final.items()
+                    for value in (old, new, image_id)
+                ),
+            ],
+        )
+    numchild = {pk: delta for pk, delta in numchild.items() if delta}
+    if numchild:
+        Annotation.objects.filter(pk__in=numchild).update(
+            numchild=F("numchild")
+            + Case(*[When(pk=pk, then=Value(delta)) for pk, delta in numchild.items()])
+        )
+
+    for path, node in moved.items():
+        node.path, node.image_id = final[path]
+        node.depth = len(node.path) // Annotation.steplen
+    return [nodes[pk] for pk in targets]
+
+
+# One LIKE per prefix: unlike LIKE ANY(array), each can use the pattern index.
+REMOVE_SQL = "DELETE FROM {table} WHERE {prefixes}"
+
+
+@transaction.atomic
+def bulk_remove(ids: list[UUID]) -> list[str]:
+    if not ids:
+        return []
+    nodes = {
+        node.pk: node
+        for node in Annotation.objects.select_for_update().filter(pk__in=ids)
+    }
+    missing = set(ids) - nodes.keys()
+    if missing:
+        raise serializers.ValidationError(
+            {"id": [f"Annotation {pk} does not exist." for pk in missing]}
+        )
+
+    # Removing a node removes its subtree, so nodes below another removed node
+    # need no work of their own.
+    removed: list[str] = []
+    for path in sorted(node.path for node in nodes.values()):
+        if not removed or not path.startswith(removed[-1]):
+            removed.append(path)
+
+    invalidate_trees(removed)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            REMOVE_SQL.format(
+                table=Annotation._meta.db_table,
+                prefixes=" OR ".join(["path LIKE %s"] * len(removed)),
+            ),
+            [f"{path}%" for path in removed],
+        )
+    numchild: dict[str, int] = defaultdict(int)
+    for path in removed:
+        if len(path) > Annotation.steplen:
+            numchild[Annotation._get_parent_path_from_path(path)] += 1
+    if numchild:
+        Annotation.objects.filter(path__in=numchild).update(
+            numchild=F("numchild")
+            - Case(*[When(path=path, then=Value(n)) for path, n in numchild.items()])
+        )
+    return removed
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Iterable, Optional
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.db import transaction
+
+from api.models import Annotation
+from api.routers import has_replayed, primary_lsn, read_database, reading_from
+
+
+class VersionedCache:
+    def __init__(self, prefix: str) -> None:
+        self.prefix = prefix
+        self.stats: Counter[str] = Counter()
+        self._local: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> BaseCache:
+        return caches[settings.ANNOTATION_CACHE_ALIAS]
+
+    def _version_key(self, scope: str) -> str:
+        return f"{self.prefix}:version:{scope}"
+
+    def bump(self, *scopes: str) -> None:
+        for scope in scopes:
+            key = self._version_key(scope)
+            try:
+                self.backend.incr(key)
+            except ValueError:
+                self.backend.add(key, time.time_ns(), timeout=None)
+
+    async def aversion(self, scope: str) -> int:
+        key = self._version_key(scope)
+        version = await self.backend.aget(key)
+        if version is None:
+            await self.backend.aadd(key, time.time_ns(), timeout=None)
+            version = await self.backend.aget(key)
+        return version
+
+    def _build(self, scope: str, version: int, build: Callable[[], Any]) -> Any:
+        # Misses follow the writes that bumped the version, which is when replicas
+        # lag the most. A replica only builds the entry once it has replayed the
+        # primary's WAL up to a position read after this version was observed, so
+        # every write that bumped to it is visible there; otherwise the primary does.
+        alias = read_database()
+        if alias is not None:
+            key = f"{self.prefix}:lsn:{scope}:{version}"
+            lsn = self.backend.get(key)
+            if lsn is None:
+                lsn = primary_lsn()
+                self.backend.add(key, lsn, timeout=settings.ANNOTATION_CACHE_TIMEOUT)
+            if not has_replayed(alias, lsn):
+                alias = None
+        with reading_from(alias):
+            return build()
+
+    def _get_local(self, full_key: str) -> Any:
+        with self._lock:
+            if full_key not in self._local:
+                return None
+            self._local.move_to_end(full_key)
+            self.stats["local_hits"] += 1
+            return self._local[full_key]
+
+    def _set_local(self, full_key: str, value: Any) -> None:
+        with self._lock:
+            self._local[full_key] = value
+            while len(self._local) > settings.ANNOTATION_CACHE_LOCAL_SIZE:
+                self._local.popitem(last=False)
+
+    async def _aget(self, full_key: str) -> Any:
+        value = self._get_local(full_key)
+        if value is not None:
+            return value
+        value = await self.backend.aget(full_key)
+        if value is not None:
+            self.stats["shared_hits"] += 1
+            self._set_local(full_key, value)
+        return value
+
+    async def aget(self, scope: str, key: str) -> Any:
+        version = await self.aversion(scope)
+        return await self._aget(f"{self.prefix}:{scope}:{version}:{key}")
+
+    async def aget_or_set(self, scope: str, key: str, build: Callable[[], Any]) -> Any:
+        # Only a miss leaves the event loop: build() runs in the request's
+        # executor thread because it queries the database.
+        version = await self.aversion(scope)
+        full_key = f"{self.prefix}:{scope}:{version}:{key}"
+        value = await self._aget(full_key)
+        if value is not None:
+            return value
+
+        self.stats["misses"] += 1
+        value = await sync_to_async(self._build)(scope, version, build)
+        await self.backend.aset(
+            full_key, value, timeout=settings.ANNOTATION_CACHE_TIMEOUT
+        )
+        self._set_local(full_key, value)
+        return value
+
+    # Remembers which scope a key was last cached under, so a hit can be served
+    # without a query to resolve it. The mapping needs no invalidation: whatever
+    # moves or removes the key bumps that scope, and the lookup then misses.
+    def _scope_key(self, key: str) -> str:
+        return f"{self.prefix}:scope:{key}"
+
+    async def ascope(self, key: str) -> Optional[str]:
+        return await self.backend.aget(self._scope_key(key))
+
+    async def aset_scope(self, key: str, scope: str) -> None:
+        await self.backend.aset(
+            self._scope_key(key), scope, timeout=settings.ANNOTATION_CACHE_TIMEOUT
+        )
+
+
+annotation_cache = VersionedCache("annotations")
+
+
+def tree_scope(path: str) -> str:
+    return f"tree:{path[:Annotation.steplen]}"
+
+
+def image_scope(pk: UUID | str) -> str:
+    return f"image:{pk}"
+
+
+def invalidate_trees(paths: Iterable[str]) -> None:
+    root_paths = {path[: Annotation.steplen] for path in paths}
+    image_ids = (
+        Annotation.objects.filter(path__in=root_paths)
+        .exclude(image=None)
+        .values_list("image_id", flat=True)
+    )
+    scopes = [tree_scope(path) for path in root_paths]
+    scopes.extend(image_scope(pk) for pk in set(image_ids))
+    transaction.on_commit(lambda: annotation_cache.bump(*scopes))
+
+
+def invalidate_image(pk: UUID | str) -> None:
+    root_paths = Annotation.objects.filter(image_id=pk, depth=1).values_list(
+        "path", flat=True
+    )
+    scopes = [image_scope(pk), *(tree_scope(path) for path in root_paths)]
+    transaction.on_commit(lambda: annotation_cache.bump(*scopes))
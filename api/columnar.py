@@ -0,0 +1,119 @@
+import json
+import struct
+import sys
+from array import array
+from typing import Iterable, Union
+
+from api.models import Annotation, AnnotationClass
+
+MAGIC = b"DANC"
+VERSION = 1
+ALIGNMENT = 8
+CLASSES = tuple(AnnotationClass.values)
+
+Column = tuple[str, Union[array, bytes]]
+
+
+def _string_column(values: Iterable[str]) -> tuple[Column, Column]:
+    offsets, data = array("i", [0]), bytearray()
+    for value in values:
+        data += value.encode()
+        offsets.append(len(data))
+    return ("<i4", offsets), ("|u1", bytes(data))
+
+
+def to_columns(nodes: list[Annotation]) -> dict:
+    index = {node.path: i for i, node in enumerate(nodes)}
+    codes = {name: code for code, name in enumerate(CLASSES)}
+    tags_offsets, tags = _string_column(",".join(node.tags or ()) for node in nodes)
+    surface_offsets, surface = _string_column(
+        ",".join(node.surface or ()) for node in nodes
+    )
+    return {
+        "count": len(nodes),
+        "classes": CLASSES,
+        "columns": {
+            "id": ("|S16", b"".join(node.pk.bytes for node in nodes)),
+            "parent": (
+                "<i4",
+                array(
+                    "i",
+                    (
+                        index.get(Annotation._get_parent_path_from_path(node.path), -1)
+                        for node in nodes
+                    ),
+                ),
+            ),
+            "class": ("|u1", bytes(codes[node.class_id] for node in nodes)),
+            "start_x": ("<i4", array("i", (node.start_x for node in nodes))),
+            "start_y": ("<i4", array("i", (node.start_y for node in nodes))),
+            "end_x": ("<i4", array("i", (node.end_x for node in nodes))),
+            "end_y": ("<i4", array("i", (node.end_y for node in nodes))),
+            "confidence": (
+                "<f4",
+                array("f", (node.confidence_percent for node in nodes)),
+            ),
+            "confirmed": ("|u1", bytes(node.confirmed for node in nodes)),
+            "tags.offsets": tags_offsets,
+            "tags.data": tags,
+            "surface.offsets": surface_offsets,
+            "surface.data": surface,
+        },
+    }
+
+
+def _little_endian(values: Union[array, bytes]) -> bytes:
+    if isinstance(values, array) and sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return bytes(values)
+
+
+def _pad(length: int) -> bytes:
+    return b"\0" * (-length % ALIGNMENT)
+
+
+def encode(data: dict) -> bytes:
+    # Layout: MAGIC, uint32 header length, JSON header, then the column buffers.
+    # The header and every column start on an 8-byte boundary, so each column can
+    # be mapped with numpy.frombuffer(buffer, dtype, offset=...) without copying.
+    body, layout = bytearray(), []
+    for name, (dtype, values) in data["columns"].items():
+        raw = _little_endian(values)
+        layout.append(
+            {"name": name, "dtype": dtype, "offset": len(body), "size": len(raw)}
+        )
+        body += raw + _pad(len(raw))
+    header = json.dumps(
+        {
+            "version": VERSION,
+            "count": data["count"],
+            "classes": list(data["classes"]),
+            "columns": layout,
+        },
+        separators=(",", ":"),
+    ).encode()
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+    return MAGIC + struct.pack("<I", len(header)) + header + bytes(body)
+
+
+def decode(buffer: bytes) -> dict:
+    if buffer[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not a columnar annotation buffer")
+    (length,) = struct.unpack_from("<I", buffer, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(buffer[start : start + length])
+    body = memoryview(buffer)[start + length :]
+    columns = {}
+    for column in header["columns"]:
+        raw = body[column["offset"] : column["offset"] + column["size"]]
+        typecode = {"<i4": "i", "<f4": "f"}.get(column["dtype"])
+        if typecode is None:
+            columns[column["name"]] = bytes(raw)
+            continue
+        values = array(typecode)
+        values.frombytes(raw)
+        if sys.byteorder == "big":
+            values.byteswap()
+        columns[column["name"]] = values
+    return {**header, "columns": columns}
@@ -0,0 +1,122 @@
+import json
+import logging
+import math
+import multiprocessing
+import os
+import posixpath
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage
+
+THUMBNAIL_SIZE = (256, 256)
+TILE_SIZE = 256
+THUMBNAIL_NAME = "thumbnail.png"
+MANIFEST_NAME = "tiles.json"
+# Image.reduce rejects these modes, so the pyramid is built in the mapped mode.
+PYRAMID_MODES = {"1": "L", "P": "RGBA", "I;16": "I"}
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[Executor] = None
+
+
+def derivatives_dir(name: str) -> str:
+    return f"{posixpath.splitext(name)[0]}_derivatives"
+
+
+def thumbnail_name(name: str) -> str:
+    return posixpath.join(derivatives_dir(name), THUMBNAIL_NAME)
+
+
+def manifest_name(name: str) -> str:
+    return posixpath.join(derivatives_dir(name), MANIFEST_NAME)
+
+
+def tile_name(name: str, level: int, col: int, row: int) -> str:
+    return posixpath.join(
+        derivatives_dir(name), "tiles", str(level), f"{col}_{row}.png"
+    )
+
+
+def _save_tiles(image: PILImage.Image, target: str, level: int) -> None:
+    level_dir = os.path.join(target, "tiles", str(level))
+    os.makedirs(level_dir, exist_ok=True)
+    for col in range(math.ceil(image.width / TILE_SIZE)):
+        for row in range(math.ceil(image.height / TILE_SIZE)):
+            box = (
+                col * TILE_SIZE,
+                row * TILE_SIZE,
+                min((col + 1) * TILE_SIZE, image.width),
+                min((row + 1) * TILE_SIZE, image.height),
+            )
+            _save_png(image.crop(box), os.path.join(level_dir, f"{col}_{row}.png"))
+
+
+def _save_png(image: PILImage.Image, path: str) -> None:
+    if image.mode == "I":
+        # PNG stores grayscale with at most 16 bits per pixel.
+        image = image.convert("I;16")
+    image.save(path, "png")
+
+
+def generate_derivatives(source: str, target: str) -> dict:
+    os.makedirs(target, exist_ok=True)
+    with PILImage.open(source) as image:
+        image.load()
+        if image.mode in PYRAMID_MODES:
+            image = image.convert(PYRAMID_MODES[image.mode])
+        elif image.mode not in ("L", "LA", "I", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        thumbnail = image.copy()
+        thumbnail.thumbnail(THUMBNAIL_SIZE)
+        _save_png(thumbnail, os.path.join(target, THUMBNAIL_NAME))
+
+        max_level = math.ceil(math.log2(max(image.width, image.height, 1)))
+        manifest = {
+            "width": image.width,
+            "height": image.height,
+            "tile_size": TILE_SIZE,
+            "levels": max_level + 1,
+        }
+        level = image
+        for depth in range(max_level, -1, -1):
+            _save_tiles(level, target, depth)
+            if depth:
+                level = level.reduce(2)
+
+    with open(os.path.join(target, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file)
+    return manifest
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _report_failure(name: str, future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(
+            "Rendering derivatives of %s failed",
+            name,
+            exc_info=future.exception(),
+        )
+
+
+def schedule_derivatives(name: str) -> None:
+    source = default_storage.path(name)
+    target = default_storage.path(derivatives_dir(name))
+    if settings.IMAGE_DERIVATIVE_WORKERS:
+        future = get_executor().submit(generate_derivatives, source, target)
+        future.add_done_callback(partial(_report_failure, name))
+    else:
+        generate_derivatives(source, target)
@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Iterator, Optional
+
+import django
+from django.core.files.storage import default_storage
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.models import Annotation, AnnotationClass, Image
+from api.pagination import KeysetPagination
+from api.serializers import AnnotationSerializer
+from api.streaming import chunked
+from api.trees import AnnotationTree
+
+IMAGE_FIELDS = ("id", "image", "width", "height", "created_at")
+ANNOTATION_FIELDS = (
+    "id",
+    "path",
+    "depth",
+    "image_id",
+    "class_id",
+    "start_x",
+    "start_y",
+    "end_x",
+    "end_y",
+    "confirmed",
+    "confidence_percent",
+    "tags",
+    "surface",
+)
+CATEGORIES = [
+    {"id": i, "name": name} for i, name in enumerate(AnnotationClass.values, start=1)
+]
+
+
+def shard_name(index: int, suffix: str) -> str:
+    return f"annotations-{index:05d}.{suffix}"
+
+
+def _coco_annotation(annotation: dict, category_ids: dict[str, int]) -> dict:
+    x0, x1 = sorted((annotation["shape"]["start_x"], annotation["shape"]["end_x"]))
+    y0, y1 = sorted((annotation["shape"]["start_y"], annotation["shape"]["end_y"]))
+    return {
+        "id": annotation["id"],
+        "category_id": category_ids[annotation["class_id"]],
+        "bbox": [x0, y0, x1 - x0, y1 - y0],
+        "area": (x1 - x0) * (y1 - y0),
+        "iscrowd": 0,
+        "score": annotation["meta"]["confidence_percent"],
+        "attributes": {
+            "confirmed": annotation["meta"]["confirmed"],
+            "parent_id": annotation["relations"][0]["label_id"]
+            if "relations" in annotation
+            else None,
+            "tags": annotation.get("tags", []),
+            "surface": annotation.get("surface", []),
+        },
+    }
+
+
+def _write(path: str, chunks: Iterator[str]) -> None:
+    with open(f"{path}.tmp", "w") as file:
+        file.writelines(chunks)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_shard(
+    index: int,
+    images: list[dict],
+    annotations: list[dict],
+    output: str,
+    media_root: Optional[str],
+) -> tuple[int, int]:
+    # Runs in a worker process: rows arrive as plain dicts and nothing here
+    # touches the database.
+    forests: dict[str, list[Annotation]] = defaultdict(list)
+    for row in annotations:
+        forests[str(row["image_id"])].append(Annotation(**row))
+    serializer = AnnotationSerializer()
+    encoder = JSONEncoder()
+    category_ids = {category["name"]: category["id"] for category in CATEGORIES}
+
+    lines, coco_images, coco_annotations = [], [], []
+    for image in images:
+        pk = str(image["id"])
+        tree = AnnotationTree(forests.pop(pk, []))
+        nodes = [node for root in tree.get_roots() for node in tree.iter_subtree(root)]
+        flat = serializer.to_flat_representation(nodes)
+        if media_root is not None:
+            target = os.path.join(output, image["image"])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(media_root, image["image"]), target)
+        record = {
+            "id": pk,
+            "file_name": image["image"],
+            "width": image["width"],
+            "height": image["height"],
+            "created_at": image["created_at"],
+        }
+        lines.append(encoder.encode({"image": record, "annotations": flat}) + "\n")
+        coco_images.append(record)
+        coco_annotations.extend(
+            {**_coco_annotation(annotation, category_ids), "image_id": pk}
+            for annotation in flat
+        )
+
+    _write(os.path.join(output, shard_name(index, "jsonl")), lines)
+    coco = {
+        "images": coco_images,
+        "annotations": coco_annotations,
+        "categories": CATEGORIES,
+    }
+    _write(os.path.join(output, shard_name(index, "coco.json")), [encoder.encode(coco)])
+    return len(images), len(coco_annotations)
+
+
+def get_executor(workers: int) -> Executor:
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    )
+
+
+def iter_shards(shard_size: int) -> Iterator[tuple[list[dict], list[dict]]]:
+    images = (
+        Image.objects.order_by(*KeysetPagination.ordering)
+        .values(*IMAGE_FIELDS)
+        .iterator(chunk_size=shard_size)
+    )
+    for batch in chunked(images, shard_size):
+        annotations = (
+            Annotation.objects.filter(image_id__in=[image["id"] for image in batch])
+            .order_by()
+            .values(*ANNOTATION_FIELDS)
+            .iterator(chunk_size=shard_size * 10)
+        )
+        yield batch, list(annotations)
+
+
+def export_dataset(
+    output: str, shard_size: int, workers: int, copy_images: bool = False
+) -> Iterator[tuple[int, int, int]]:
+    os.makedirs(output, exist_ok=True)
+    media_root = default_storage.location if copy_images else None
+    if not workers:
+        for index, (images, annotations) in enumerate(iter_shards(shard_size)):
+            yield index, *export_shard(index, images, annotations, output, media_root)
+        return
+
+    # At most two shards per worker are in flight, so memory stays bounded no
+    # matter how large the dataset is.
+    pending: dict[int, Future] = {}
+    with get_executor(workers) as executor:
+        for index, (images, annotations) in enumerate(iter_shards(shard_size)):
+            pending[index] = executor.submit(
+                export_shard, index, images, annotations, output, media_root
+            )
+            while len(pending) >= workers * 2:
+                done = min(pending)
+                yield done, *pending.pop(done).result()
+        for index in sorted(pending):
+            yield index, *pending.pop(index).result()
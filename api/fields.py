@@ -0,0 +1,69 @@
+from django.db import models
+from django.db.models.fields.files import (
+    FieldFile,
+    ImageFieldFile,
+    ImageFileDescriptor,
+)
+
+from api.uploads import probe_image_size
+
+
+class ProbedImageFieldFile(ImageFieldFile):
+    def _get_image_dimensions(self):
+        if not hasattr(self, "_dimensions_cache"):
+            self._dimensions_cache = probe_image_size(self)
+        return self._dimensions_cache
+
+
+class ProbedImageFileDescriptor(ImageFileDescriptor):
+    def __set__(self, instance, value):
+        previous_file = instance.__dict__.get(self.field.attname)
+        if (
+            isinstance(value, str)
+            and isinstance(previous_file, FieldFile)
+            and previous_file.name == value
+        ):
+            # FieldFile.save() re-assigns the stored name after committing the
+            # upload; the dimensions were already probed from the upload itself.
+            instance.__dict__[self.field.attname] = value
+            return
+        super().__set__(instance, value)
+
+
+class ProbedImageField(models.ImageField):
+    attr_class = ProbedImageFieldFile
+    descriptor_class = ProbedImageFileDescriptor
+
+
+class BoxField(models.Field):
+    def db_type(self, connection) -> str:
+        return "box"
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        start_x, start_y, end_x, end_y = value
+        return f"(({start_x},{start_y}),({end_x},{end_y}))"
+
+
+@BoxField.register_lookup
+class Overlaps(models.Lookup):
+    lookup_name = "overlaps"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} && ({rhs})::box", (*lhs_params, *rhs_params)
+
+
+class Point(models.Func):
+    function = "point"
+    output_field = models.Field()
+
+
+class BoundingBox(models.Func):
+    function = "box"
+    output_field = BoxField()
+
+    def __init__(self, start_x: str, start_y: str, end_x: str, end_y: str) -> None:
+        super().__init__(Point(start_x, start_y), Point(end_x, end_y))
@@ -0,0 +1,58 @@
+from django.db.models import QuerySet
+from rest_framework.exceptions import ValidationError
+
+from api.fields import BoundingBox
+from api.models import Annotation, AnnotationClass
+
+FILTER_PARAMS = (
+    "bbox",
+    "class_id",
+    "min_confidence_percent",
+    "confirmed",
+    "tag",
+    "surface",
+)
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+
+def parse_bbox(value: str) -> tuple[int, int, int, int]:
+    try:
+        start_x, start_y, end_x, end_y = (int(item) for item in value.split(","))
+    except ValueError:
+        raise ValidationError(
+            {"bbox": ["Expected four integers: start_x,start_y,end_x,end_y."]}
+        )
+    return start_x, start_y, end_x, end_y
+
+
+def is_filtered(params) -> bool:
+    return any(param in params for param in FILTER_PARAMS)
+
+
+def filter_annotations(queryset: QuerySet[Annotation], params) -> QuerySet[Annotation]:
+    if "bbox" in params:
+        queryset = queryset.alias(
+            bbox=BoundingBox("start_x", "start_y", "end_x", "end_y")
+        ).filter(bbox__overlaps=parse_bbox(params["bbox"]))
+    if "class_id" in params:
+        if params["class_id"] not in AnnotationClass.values:
+            raise ValidationError(
+                {"class_id": [f"Expected one of: {', '.join(AnnotationClass.values)}."]}
+            )
+        queryset = queryset.filter(class_id=params["class_id"])
+    if "min_confidence_percent" in params:
+        try:
+            confidence = float(params["min_confidence_percent"])
+        except ValueError:
+            raise ValidationError({"min_confidence_percent": ["Expected a number."]})
+        queryset = queryset.filter(confidence_percent__gte=confidence)
+    if "confirmed" in params:
+        confirmed = BOOLEAN_VALUES.get(params["confirmed"].lower())
+        if confirmed is None:
+            raise ValidationError({"confirmed": ["Expected true or false."]})
+        queryset = queryset.filter(confirmed=confirmed)
+    if "tag" in params:
+        queryset = queryset.filter(tags__contains=params.getlist("tag"))
+    if "surface" in params:
+        queryset = queryset.filter(surface__contains=params.getlist("surface"))
+    return queryset.order_by("path")
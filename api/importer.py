@@ -0,0 +1,240 @@
+import csv
+import io
+import json
+import os
+import uuid
+from collections import defaultdict
+from typing import Any, Iterable, Iterator, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from api.bulk import build_nodes, lock_roots, topological_order
+from api.models import Annotation, Image
+from api.type_defs import AnnotationFlatDict
+from api.validation import Invalid, flatten_annotations, validate_image_record
+
+# Images without an id get one derived from the source file name and line number,
+# so re-running an import after a crash recognizes what was already loaded.
+IMPORT_NAMESPACE = uuid.UUID("6f1c3b52-8a51-4a3e-9c1e-2f0b7d0e4a11")
+IMAGE_COLUMNS = (
+    "id",
+    "image",
+    "width",
+    "height",
+    "is_active",
+    "is_deleted",
+    "created_at",
+    "updated_at",
+)
+ANNOTATION_COLUMNS = (
+    "id",
+    "path",
+    "depth",
+    "numchild",
+    "is_active",
+    "is_deleted",
+    "created_at",
+    "updated_at",
+    "image_id",
+    "class_id",
+    "start_x",
+    "start_y",
+    "end_x",
+    "end_y",
+    "confirmed",
+    "confidence_percent",
+    "tags",
+    "surface",
+)
+
+Record = tuple[dict, list[AnnotationFlatDict]]
+
+
+def _array(values: Optional[list[str]]) -> Optional[str]:
+    if values is None:
+        return None
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'"{value}"' for value in escaped) + "}"
+
+
+def copy_rows(table: str, columns: Iterable[str], rows: Iterable[tuple]) -> None:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    with connection.cursor() as cursor:
+        if hasattr(cursor.cursor, "copy_expert"):
+            buffer.seek(0)
+            cursor.cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def parse_record(raw: bytes, source: str, line: int) -> Record:
+    try:
+        data = json.loads(raw)
+    except ValueError as error:
+        raise serializers.ValidationError({"line": [f"Invalid JSON: {error}"]})
+    if not isinstance(data, dict):
+        raise serializers.ValidationError({"line": ["Expected a JSON object."]})
+    try:
+        image = validate_image_record(data.get("image"))
+    except Invalid as error:
+        raise serializers.ValidationError({"image": error.detail})
+    if "created_at" in image:
+        image["created_at"] = parse_datetime(image["created_at"])
+        if image["created_at"] is None:
+            raise serializers.ValidationError(
+                {"image": {"created_at": ["Expected an ISO 8601 datetime."]}}
+            )
+    if not isinstance(data.get("annotations"), list):
+        raise serializers.ValidationError(
+            {"annotations": ["Expected a list of annotations."]}
+        )
+    items, errors = flatten_annotations(data["annotations"])
+    if any(errors):
+        raise serializers.ValidationError({"annotations": errors})
+
+    ids = {item["id"] for item in items}
+    foreign = {item["parent"] for item in items if "parent" in item} - ids
+    if foreign:
+        raise serializers.ValidationError(
+            {
+                "annotations": [
+                    f"Parent {pk} is not part of this image." for pk in foreign
+                ]
+            }
+        )
+    topological_order(items)
+    image.setdefault("id", uuid.uuid5(IMPORT_NAMESPACE, f"{source}:{line}"))
+    for item in items:
+        item.pop("image", None)
+        if "parent" not in item:
+            item["image_id"] = image["id"]
+    return image, items
+
+
+@transaction.atomic
+def import_records(records: list[Record]) -> tuple[int, int]:
+    existing = set(
+        Image.all_objects.filter(
+            pk__in=[image["id"] for image, _ in records]
+        ).values_list("pk", flat=True)
+    )
+    records = [record for record in records if record[0]["id"] not in existing]
+    if not records:
+        return 0, 0
+
+    lock_roots()
+    last_root = Annotation.get_last_root_node()
+    items = [item for _, record_items in records for item in record_items]
+    ordered = topological_order(items)
+    groups: dict[Any, list[AnnotationFlatDict]] = defaultdict(list)
+    for item in ordered:
+        groups[item.get("parent")].append(item)
+    nodes = build_nodes(ordered, groups, {}, {"": last_root} if last_root else {})
+
+    now = timezone.now()
+    copy_rows(
+        Image._meta.db_table,
+        IMAGE_COLUMNS,
+        (
+            (
+                image["id"],
+                image["file_name"],
+                image["width"],
+                image["height"],
+                True,
+                False,
+                image.get("created_at", now),
+                now,
+            )
+            for image, _ in records
+        ),
+    )
+    copy_rows(
+        Annotation._meta.db_table,
+        ANNOTATION_COLUMNS,
+        (
+            (
+                node.pk,
+                node.path,
+                node.depth,
+                node.numchild,
+                True,
+                False,
+                now,
+                now,
+                node.image_id,
+                node.class_id,
+                node.start_x,
+                node.start_y,
+                node.end_x,
+                node.end_y,
+                node.confirmed,
+                node.confidence_percent,
+                _array(node.tags),
+                _array(node.surface),
+            )
+            for node in nodes.values()
+        ),
+    )
+    return len(records), len(nodes)
+
+
+def read_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"offset": 0, "line": 0, "images": 0, "annotations": 0}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_checkpoint(path: str, checkpoint: dict) -> None:
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def import_annotations(
+    path: str, batch_size: int, checkpoint_path: str
+) -> Iterator[tuple[dict, list[tuple[int, Any]]]]:
+    checkpoint = read_checkpoint(checkpoint_path)
+    source = os.path.basename(path)
+    with open(path, "rb") as file:
+        file.seek(checkpoint["offset"])
+        offset, line = checkpoint["offset"], checkpoint["line"]
+        records: list[Record] = []
+        errors: list[tuple[int, Any]] = []
+        for raw in file:
+            offset += len(raw)
+            line += 1
+            if not raw.strip():
+                continue
+            try:
+                records.append(parse_record(raw, source, line))
+            except serializers.ValidationError as error:
+                errors.append((line, error.detail))
+            if len(records) == batch_size:
+                yield _commit(
+                    records, checkpoint, checkpoint_path, offset, line
+                ), errors
+                records, errors = [], []
+        if records or errors:
+            yield _commit(records, checkpoint, checkpoint_path, offset, line), errors
+
+
+def _commit(
+    records: list[Record], checkpoint: dict, path: str, offset: int, line: int
+) -> dict:
+    images, annotations = import_records(records) if records else (0, 0)
+    checkpoint.update(
+        offset=offset,
+        line=line,
+        images=checkpoint["images"] + images,
+        annotations=checkpoint["annotations"] + annotations,
+    )
+    write_checkpoint(path, checkpoint)
+    return checkpoint
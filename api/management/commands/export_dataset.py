@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from api.export import export_dataset
+
+
+class Command(BaseCommand):
+    help = "Export images and annotation trees to sharded JSONL and COCO files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output")
+        parser.add_argument("--shard-size", type=int, default=500)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Serialization processes; 0 serializes in this process.",
+        )
+        parser.add_argument(
+            "--copy-images",
+            action="store_true",
+            help="Copy the original image files next to the shards.",
+        )
+
+    def handle(self, *args, output, shard_size, workers, copy_images, **options):
+        images = annotations = 0
+        for index, shard_images, shard_annotations in export_dataset(
+            output, shard_size, workers, copy_images
+        ):
+            images += shard_images
+            annotations += shard_annotations
+            self.stdout.write(
+                f"Shard {index}: {shard_images} images, {shard_annotations} annotations"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Exported {images} images, {annotations} annotations")
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from rest_framework import serializers
+
+from api.importer import import_annotations
+
+
+class Command(BaseCommand):
+    help = "Import images and annotation trees from a JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--checkpoint",
+            help="Progress file used to resume; defaults to <input>.checkpoint.",
+        )
+
+    def handle(self, *args, input, batch_size, checkpoint, **options):
+        checkpoint = checkpoint or f"{input}.checkpoint"
+        progress = None
+        try:
+            for progress, errors in import_annotations(input, batch_size, checkpoint):
+                for line, detail in errors:
+                    self.stderr.write(f"Line {line} skipped: {detail}")
+                self.stdout.write(
+                    f"Line {progress['line']}: {progress['images']} images, "
+                    f"{progress['annotations']} annotations"
+                )
+        except (DatabaseError, serializers.ValidationError) as error:
+            raise CommandError(f"Import stopped, resume from {checkpoint}: {error}")
+        if progress is not None:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Imported {progress['images']} images, "
+                    f"{progress['annotations']} annotations"
+                )
+            )
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.purge import purge_deleted_images
+
+
+class Command(BaseCommand):
+    help = "Remove soft-deleted images, their annotations and files in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.IMAGE_PURGE_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=0,
+            help="Only purge images deleted at least this many seconds ago.",
+        )
+
+    def handle(self, *args, batch_size: int, grace: int, **options):
+        purged = 0
+        for image, annotations in purge_deleted_images(
+            batch_size, timedelta(seconds=grace)
+        ):
+            purged += 1
+            self.stdout.write(f"Purged image {image.pk} ({annotations} annotations)")
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} images"))
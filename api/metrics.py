@@ -0,0 +1,164 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from api.cache import annotation_cache
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: dict[tuple[tuple[str, str], ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i in range(index, len(self.buckets)):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {key: (list(b), s, c) for key, (b, s, c) in self._series.items()}
+        for key, (buckets, total, count) in sorted(series.items()):
+            labels = dict(key)
+            for bound, value in zip(self.buckets, buckets):
+                bucket_labels = _format_labels({**labels, "le": f"{bound:g}"})
+                yield f"{self.name}_bucket{{{bucket_labels}}} {value}"
+            bucket_labels = _format_labels({**labels, "le": "+Inf"})
+            yield f"{self.name}_bucket{{{bucket_labels}}} {count}"
+            yield f"{self.name}_sum{{{_format_labels(labels)}}} {total:g}"
+            yield f"{self.name}_count{{{_format_labels(labels)}}} {count}"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Total request latency.", SECONDS_BUCKETS
+)
+request_db_duration = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent executing SQL per request.",
+    SECONDS_BUCKETS,
+)
+request_queries = Histogram(
+    "http_request_db_queries", "SQL queries executed per request.", QUERY_BUCKETS
+)
+request_serialize_duration = Histogram(
+    "http_request_serialize_duration_seconds",
+    "Time spent serializing and rendering responses per request.",
+    SECONDS_BUCKETS,
+)
+HISTOGRAMS = (
+    request_duration,
+    request_db_duration,
+    request_queries,
+    request_serialize_duration,
+)
+
+
+class RequestTimings:
+    def __init__(self) -> None:
+        self.queries = 0
+        self.durations: defaultdict[str, float] = defaultdict(float)
+        self._active: set[str] = set()
+
+    def server_timing(self, total: float) -> str:
+        entries = [
+            f'db;desc="{self.queries} queries";dur={self.durations["db"] * 1000:.1f}'
+        ]
+        entries.extend(
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in self.durations.items()
+            if name != "db"
+        )
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def track_request() -> Iterator[RequestTimings]:
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection; the timings are looked up through the
+    # context so queries run via sync_to_async count towards their request.
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.durations["db"] += time.perf_counter() - start
+        timings.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs) -> None:
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    timings = _current.get()
+    # Nested spans of the same name (a list serializer calling its children) are
+    # only counted once, by the outermost one.
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[name] += time.perf_counter() - start
+        timings._active.discard(name)
+
+
+def render_metrics() -> str:
+    lines = [line for histogram in HISTOGRAMS for line in histogram.collect()]
+    lines.append("# HELP annotation_cache_requests_total Annotation cache lookups.")
+    lines.append("# TYPE annotation_cache_requests_total counter")
+    for result in ("local_hits", "shared_hits", "misses"):
+        lines.append(
+            f'annotation_cache_requests_total{{result="{result}"}} '
+            f"{annotation_cache.stats[result]}"
+        )
+    return "\n".join(lines) + "\n"
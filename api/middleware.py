@@ -0,0 +1,43 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from api import metrics
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with metrics.track_request() as timings:
+            response = self.get_response(request)
+        return self.record(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with metrics.track_request() as timings:
+            response = await self.get_response(request)
+        return self.record(request, response, timings, time.perf_counter() - start)
+
+    def record(self, request, response, timings, total):
+        match = request.resolver_match
+        if match is None or match.url_name == "metrics":
+            return response
+        labels = {"method": request.method, "route": match.route}
+        metrics.request_duration.observe(total, **labels)
+        metrics.request_db_duration.observe(timings.durations["db"], **labels)
+        metrics.request_queries.observe(timings.queries, **labels)
+        metrics.request_serialize_duration.observe(
+            timings.durations["serialize"] + timings.durations["render"], **labels
+        )
+        response["Server-Timing"] = timings.server_timing(total)
+        return response
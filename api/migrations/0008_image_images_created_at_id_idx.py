@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0007_alter_annotation_image"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["created_at", "id"], name="images_created_at_id_idx"
+            ),
+        ),
+    ]
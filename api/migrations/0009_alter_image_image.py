@@ -0,0 +1,20 @@
+# Generated by Django 5.0 on 2026-10-18 02:26
+
+import api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0008_image_images_created_at_id_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="image",
+            name="image",
+            field=api.fields.ProbedImageField(
+                height_field="height", upload_to="images/", width_field="width"
+            ),
+        ),
+    ]
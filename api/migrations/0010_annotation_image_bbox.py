@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 02:29
+
+import api.fields
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_alter_image_image"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                UPDATE annotations AS node
+                SET image_id = root.image_id
+                FROM annotations AS root
+                WHERE root.depth = 1
+                  AND node.depth > 1
+                  AND substr(node.path, 1, 4) = root.path
+                  AND node.image_id IS DISTINCT FROM root.image_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="annotation",
+            index=django.contrib.postgres.indexes.GistIndex(
+                api.fields.BoundingBox("start_x", "start_y", "end_x", "end_y"),
+                name="annotations_bbox_gist",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0 on 2026-10-18 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_annotation_image_bbox"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="annotation",
+            index=models.Index(
+                fields=["image", "class_id", "confidence_percent"],
+                name="annotations_image_class_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="annotation",
+            index=models.Index(
+                condition=models.Q(("confirmed", False)),
+                fields=["image", "class_id", "confidence_percent"],
+                name="annotations_unconfirmed_idx",
+            ),
+        ),
+    ]
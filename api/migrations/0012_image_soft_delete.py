@@ -0,0 +1,44 @@
+# Generated by Django 5.0 on 2026-10-18 02:36
+
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0011_annotation_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="image",
+            options={"base_manager_name": "all_objects"},
+        ),
+        migrations.AlterModelManagers(
+            name="image",
+            managers=[
+                ("objects", django.db.models.manager.Manager()),
+                ("all_objects", django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="image",
+            name="images_created_at_id_idx",
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                condition=models.Q(("is_deleted", False)),
+                fields=["created_at", "id"],
+                name="images_live_created_at_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                condition=models.Q(("is_deleted", True)),
+                fields=["updated_at"],
+                name="images_deleted_idx",
+            ),
+        ),
+    ]
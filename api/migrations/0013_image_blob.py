@@ -0,0 +1,50 @@
+# Generated by Django 5.0 on 2026-10-18 02:54
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0012_image_soft_delete"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageBlob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+                ("is_deleted", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("sha256", models.CharField(max_length=64, unique=True)),
+                ("name", models.CharField(max_length=100)),
+                ("width", models.IntegerField()),
+                ("height", models.IntegerField()),
+                ("refcount", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "db_table": "image_blobs",
+            },
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="blob",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="images",
+                to="api.imageblob",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 03:09
+
+import api.fields
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0013_image_blob"),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.RemoveIndex(
+            model_name="annotation",
+            name="annotations_bbox_gist",
+        ),
+        migrations.AddIndex(
+            model_name="annotation",
+            index=django.contrib.postgres.indexes.GistIndex(
+                models.F("image"),
+                api.fields.BoundingBox("start_x", "start_y", "end_x", "end_y"),
+                name="annotations_image_bbox_gist",
+            ),
+        ),
+    ]
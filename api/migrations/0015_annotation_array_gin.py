@@ -0,0 +1,25 @@
+# Generated by Django 5.0 on 2026-10-18 03:10
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0014_annotation_image_bbox_gist"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="annotation",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="annotations_tags_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="annotation",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["surface"], name="annotations_surface_gin"
+            ),
+        ),
+    ]
@@ -1,10 +1,14 @@
 import uuid
 
 from django.db import models
+from django.db.models import F
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, GistIndex
 from django.utils.translation import gettext_lazy as _
 
-from treebeard.mp_tree import MP_Node
+from treebeard.mp_tree import MP_Node, MP_NodeManager
+
+from api.fields import BoundingBox, ProbedImageField
 
 
 class AnnotationClass(models.TextChoices):
@@ -23,20 +27,58 @@ class BaseModel(models.Model):
         abstract = True
 
 
+class LiveManager(models.Manager):
+    def get_queryset(self) -> models.QuerySet:
+        return super().get_queryset().filter(is_deleted=False)
+
+
+class AnnotationManager(MP_NodeManager):
+    def live(self) -> models.QuerySet:
+        return self.exclude(image__is_deleted=True)
+
+
+class ImageBlob(BaseModel):
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100)
+    width = models.IntegerField(null=False)
+    height = models.IntegerField(null=False)
+    refcount = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "image_blobs"
+
+
 class Image(BaseModel):
-    image = models.ImageField(
+    image = ProbedImageField(
         upload_to="images/", width_field="width", height_field="height"
     )
     width = models.IntegerField(null=False)
     height = models.IntegerField(null=False)
+    blob = models.ForeignKey(
+        ImageBlob, on_delete=models.PROTECT, null=True, related_name="images"
+    )
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     class Meta:
         db_table = "images"
+        base_manager_name = "all_objects"
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(is_deleted=False),
+                name="images_live_created_at_id_idx",
+            ),
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(is_deleted=True),
+                name="images_deleted_idx",
+            ),
+        ]
 
 
 class Annotation(MP_Node, BaseModel):
-    node_order_by = ["class_id"]
-
     image = models.ForeignKey(Image, on_delete=models.CASCADE, null=True)
     class_id = models.CharField(
         max_length=100, choices=AnnotationClass.choices, null=False
@@ -50,5 +92,25 @@ class Annotation(MP_Node, BaseModel):
     tags = ArrayField(models.CharField(max_length=20), blank=True, null=True)
     surface = ArrayField(models.CharField(max_length=10), blank=True, null=True)
 
+    objects = AnnotationManager()
+
     class Meta:
         db_table = "annotations"
+        indexes = [
+            GistIndex(
+                F("image"),
+                BoundingBox("start_x", "start_y", "end_x", "end_y"),
+                name="annotations_image_bbox_gist",
+            ),
+            models.Index(
+                fields=["image", "class_id", "confidence_percent"],
+                name="annotations_image_class_idx",
+            ),
+            models.Index(
+                fields=["image", "class_id", "confidence_percent"],
+                condition=models.Q(confirmed=False),
+                name="annotations_unconfirmed_idx",
+            ),
+            GinIndex(fields=["tags"], name="annotations_tags_gin"),
+            GinIndex(fields=["surface"], name="annotations_surface_gin"),
+        ]
@@ -0,0 +1,83 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    ordering = ("created_at", "id")
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view=None
+    ) -> list:
+        self.request = request
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        if position:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+                created_at__gte=created_at,
+            )
+        page_size = self.get_page_size(request)
+        page = list(queryset[: page_size + 1])
+        self.next_position = (
+            (page[page_size - 1].created_at, page[page_size - 1].pk)
+            if len(page) > page_size
+            else None
+        )
+        return page[:page_size]
+
+    def get_paginated_response(self, data) -> Response:
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(*self.next_position)
+        )
+
+    def encode_cursor(self, created_at: datetime, pk: UUID) -> str:
+        value = f"{created_at.isoformat()}|{pk}"
+        return urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, request: Request) -> Optional[tuple[datetime, UUID]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_at, pk = urlsafe_b64decode(encoded.encode()).decode().split("|")
+            return datetime.fromisoformat(created_at), UUID(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,200 @@
+from typing import Any, Optional
+from uuid import UUID
+
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import serializers
+
+from api.bulk import bulk_create_forest, bulk_move, bulk_remove
+from api.cache import invalidate_image, invalidate_trees
+from api.models import Annotation, Image
+from api.type_defs import AnnotationFlatDict
+from api.validation import flatten_annotations, validate_annotation_patch
+
+OPERATIONS = ("add", "remove", "replace", "move")
+
+
+def _changed_fields(instance: Annotation, changes: dict) -> dict:
+    return {
+        key: value
+        for key, value in changes.items()
+        if key != "parent" and getattr(instance, key) != value
+    }
+
+
+def _update(instance: Annotation, changed: dict) -> None:
+    # Only the columns that differ are written, in a single UPDATE.
+    Annotation.objects.filter(pk=instance.pk).update(
+        **changed, updated_at=timezone.now()
+    )
+    for key, value in changed.items():
+        setattr(instance, key, value)
+
+
+def _is_move(instance: Annotation, parent: Optional[UUID]) -> bool:
+    return parent is not None or instance.depth > 1
+
+
+@transaction.atomic
+def patch_annotation(pk: UUID | str, changes: dict) -> Annotation:
+    instance = get_object_or_404(
+        Annotation.objects.live().select_for_update(of=("self",)), pk=pk
+    )
+    changed = _changed_fields(instance, changes)
+    if changed:
+        invalidate_trees([instance.path])
+        _update(instance, changed)
+    if "parent" in changes and _is_move(instance, changes["parent"]):
+        for moved in bulk_move([(instance.pk, changes["parent"])]):
+            instance.path, instance.depth = moved.path, moved.depth
+            instance.image_id = moved.image_id
+    return instance
+
+
+def _parse_path(value: Any) -> Optional[UUID]:
+    if isinstance(value, str) and value.startswith("/"):
+        if value == "/":
+            return None
+        try:
+            return UUID(value[1:])
+        except ValueError:
+            pass
+    raise serializers.ValidationError(
+        [f"Expected '/' or '/<annotation id>', got {value!r}."]
+    )
+
+
+def _parse_operation(operation: Any) -> tuple:
+    if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+        raise serializers.ValidationError(
+            {"op": [f"Expected one of {', '.join(OPERATIONS)}."]}
+        )
+    op, errors, parsed = operation["op"], {}, [operation["op"]]
+    keys = {"add": ("path",), "move": ("from", "path")}.get(op, ("path",))
+    for key in keys:
+        try:
+            parsed.append(_parse_path(operation.get(key)))
+        except serializers.ValidationError as error:
+            errors[key] = error.detail
+    if op in ("remove", "replace") and not errors and parsed[1] is None:
+        errors["path"] = ["The root path cannot be removed or replaced."]
+    if op == "move" and not errors and parsed[1] is None:
+        errors["from"] = ["Expected '/<annotation id>'."]
+    if op == "add":
+        items, item_errors = flatten_annotations([operation.get("value")])
+        if item_errors[0]:
+            errors["value"] = item_errors[0]
+        parsed.append(items[0])
+    if op == "replace":
+        try:
+            parsed.append(validate_annotation_patch(operation.get("value")))
+        except serializers.ValidationError as error:
+            errors["value"] = error.detail
+    if errors:
+        raise serializers.ValidationError(errors)
+    return tuple(parsed)
+
+
+def parse_operations(operations: Any) -> list[tuple]:
+    if not isinstance(operations, list):
+        raise serializers.ValidationError(
+            {"non_field_errors": ["Expected a list of patch operations."]}
+        )
+    parsed, errors = [], []
+    for operation in operations:
+        try:
+            parsed.append(_parse_operation(operation))
+            errors.append({})
+        except serializers.ValidationError as error:
+            parsed.append(None)
+            errors.append(error.detail)
+    if any(errors):
+        raise serializers.ValidationError(errors)
+    return parsed
+
+
+def _targets(op: tuple) -> dict[str, Optional[UUID]]:
+    if op[0] == "move":
+        return {"from": op[1], "path": op[2]}
+    if op[0] == "replace":
+        return {"path": op[1], "value": op[2].get("parent")}
+    return {"path": op[1]}
+
+
+@transaction.atomic
+def apply_patch(image: Image, operations: Any) -> list[Annotation]:
+    parsed = parse_operations(operations)
+    added = {op[2]["id"] for op in parsed if op[0] == "add"}
+    targets = [_targets(op) for op in parsed]
+    nodes = (
+        Annotation.objects.select_for_update()
+        .filter(image=image)
+        .in_bulk({pk for target in targets for pk in target.values() if pk})
+    )
+    removed = tuple(
+        nodes[op[1]].path for op in parsed if op[0] == "remove" and op[1] in nodes
+    )
+    existing = (
+        set(Annotation.objects.filter(pk__in=added).values_list("pk", flat=True))
+        if added
+        else set()
+    )
+
+    errors: list[dict] = []
+    seen: set[UUID] = set()
+    for op, target in zip(parsed, targets):
+        error = {}
+        if op[0] == "add":
+            pk = op[2]["id"]
+            if pk in existing:
+                error["value"] = [f"Annotation {pk} already exists."]
+            elif pk in seen:
+                error["value"] = [f"Annotation {pk} is added by this patch."]
+            seen.add(pk)
+        for key, pk in target.items():
+            if pk is None or (op[0] == "add" and pk in added):
+                continue
+            if pk in added:
+                error[key] = [f"Annotation {pk} is added by this patch."]
+            elif pk not in nodes:
+                error[key] = [f"Annotation {pk} does not exist in this image."]
+            elif op[0] != "remove" and nodes[pk].path.startswith(removed):
+                error[key] = [f"Annotation {pk} is removed by this patch."]
+        errors.append(error)
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+    invalidate_image(image.pk)
+    if removed:
+        bulk_remove([op[1] for op in parsed if op[0] == "remove"])
+
+    touched, moves = [], []
+    items: list[AnnotationFlatDict] = []
+    for op in parsed:
+        if op[0] == "replace":
+            instance, changes = nodes[op[1]], op[2]
+            changed = _changed_fields(instance, changes)
+            if changed:
+                _update(instance, changed)
+            if "parent" in changes and _is_move(instance, changes["parent"]):
+                moves.append((instance.pk, changes["parent"]))
+            touched.append(instance.pk)
+        elif op[0] == "move":
+            moves.append((op[1], op[2]))
+            touched.append(op[1])
+        elif op[0] == "add":
+            item = {key: value for key, value in op[2].items() if key != "parent"}
+            if op[1] is None:
+                item["image"] = image
+            else:
+                item["parent"] = op[1]
+            items.append(item)
+            touched.append(item["id"])
+
+    if moves:
+        bulk_move(moves)
+    if items:
+        instances, _ = bulk_create_forest(items)
+        invalidate_trees(instance.path for instance in instances)
+    return list(Annotation.objects.filter(pk__in=touched).order_by("path"))
@@ -0,0 +1,53 @@
+import shutil
+from datetime import timedelta
+from typing import Iterator
+
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+
+from api.blobs import release_blob
+from api.derivatives import derivatives_dir
+from api.models import Annotation, Image
+
+DELETE_ANNOTATIONS_SQL = """
+DELETE FROM {table} WHERE id IN (
+    SELECT id FROM {table} WHERE image_id = %s LIMIT %s
+)
+"""
+
+
+def delete_annotations(image: Image, batch_size: int) -> int:
+    # Every node of the forest goes, so the tree bookkeeping treebeard does on
+    # delete is skipped and rows are removed in short autocommitted batches.
+    deleted = 0
+    sql = DELETE_ANNOTATIONS_SQL.format(table=Annotation._meta.db_table)
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [image.pk, batch_size])
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+
+def delete_files(name: str) -> None:
+    default_storage.delete(name)
+    shutil.rmtree(default_storage.path(derivatives_dir(name)), ignore_errors=True)
+
+
+def purge_deleted_images(
+    batch_size: int, grace: timedelta = timedelta()
+) -> Iterator[tuple[Image, int]]:
+    images = Image.all_objects.filter(
+        is_deleted=True, updated_at__lte=timezone.now() - grace
+    ).order_by("updated_at")
+    for image in images.iterator(chunk_size=batch_size):
+        deleted = delete_annotations(image, batch_size)
+        purged, _ = Image.all_objects.filter(pk=image.pk, is_deleted=True).delete()
+        if not purged:
+            continue
+        # Deduplicated files are shared; images from before blobs own theirs.
+        name = release_blob(image.blob_id) if image.blob_id else image.image.name
+        if name:
+            delete_files(name)
+        yield image, deleted
@@ -0,0 +1,25 @@
+from rest_framework import renderers
+
+from api.columnar import encode
+from api.metrics import span
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span("render"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ColumnarRenderer(renderers.BaseRenderer):
+    media_type = "application/vnd.dentiai.annotations+columnar"
+    format = "columnar"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get("response")
+        if response is not None and response.exception:
+            response["Content-Type"] = JSONRenderer.media_type
+            return JSONRenderer().render(data, accepted_media_type, renderer_context)
+        with span("render"):
+            return encode(data)
@@ -0,0 +1,99 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_COOKIE = "read_primary"
+
+# A server that is not in recovery has applied all of its own WAL.
+REPLAYED_SQL = """
+SELECT COALESCE(
+    CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+    ELSE pg_current_wal_lsn() END >= %s::pg_lsn,
+    false
+)
+"""
+
+_read_database: ContextVar[Optional[str]] = ContextVar("read_database", default=None)
+
+
+def read_database() -> Optional[str]:
+    return _read_database.get()
+
+
+@contextmanager
+def reading_from(alias: Optional[str]) -> Iterator[None]:
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def primary_lsn() -> str:
+    with connections["default"].cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()")
+        return str(cursor.fetchone()[0])
+
+
+def has_replayed(alias: str, lsn: str) -> bool:
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REPLAYED_SQL, [lsn])
+        return cursor.fetchone()[0]
+
+
+def replica_for(request) -> Optional[str]:
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return None
+    # Clients that wrote recently read from the primary until their cookie
+    # expires, so they always see their own changes.
+    if PRIMARY_COOKIE in request.COOKIES:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+class ReplicaReadsMixin:
+    # Safe requests read from a random replica; writes mark the client with a
+    # cookie that keeps its reads on the primary for REPLICA_STICKY_SECONDS.
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = replica_for(request)
+        if iscoroutinefunction(super().dispatch):
+            return self._adispatch(alias, request, *args, **kwargs)
+        with reading_from(alias):
+            return super().dispatch(request, *args, **kwargs)
+
+    async def _adispatch(self, alias, request, *args, **kwargs):
+        with reading_from(alias):
+            return await super().dispatch(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -2,20 +2,103 @@ from __future__ import annotations
 
 from typing import cast, Literal, Optional
 
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+from treebeard.exceptions import PathOverflow
 
+from api.blobs import acquire_blob, blob_exists, release_blob
+from api.bulk import bulk_create_forest, bulk_move, lock_roots, path_overflow
+from api.cache import invalidate_trees
+from api.metrics import span
 from api.models import Image, Annotation
+from api.purge import delete_files
+from api.trees import AnnotationTree
+from api.uploads import probe_image_size
+from api.validation import validate_annotation, validate_annotations
 from api.type_defs import AnnotationDict, AnnotationExternalDict, AnnotationFlatDict
 
 
 class ImageSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(use_url=True)
+    image = serializers.FileField(use_url=True)
     width = serializers.IntegerField(read_only=True)
     height = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Image
-        fields = "__all__"
+        exclude = ["blob"]
+
+    @property
+    def data(self) -> ReturnDict:
+        with span("serialize"):
+            return super().data
+
+    def validate_image(self, value):
+        # Bytes that are already stored were probed when they were first uploaded.
+        if not blob_exists(value) and None in probe_image_size(value):
+            raise serializers.ValidationError(
+                serializers.ImageField.default_error_messages["invalid_image"]
+            )
+        return value
+
+    @transaction.atomic
+    def create(self, validated_data) -> Image:
+        blob = acquire_blob(validated_data.pop("image"))
+        return Image.objects.create(
+            image=blob.name,
+            width=blob.width,
+            height=blob.height,
+            blob=blob,
+            **validated_data,
+        )
+
+    @transaction.atomic
+    def update(self, instance: Image, validated_data) -> Image:
+        if "image" not in validated_data:
+            return super().update(instance, validated_data)
+        previous_blob, previous_name = instance.blob_id, instance.image.name
+        # Acquire before releasing so re-uploading the same bytes never drops the
+        # blob's refcount to zero.
+        blob = acquire_blob(validated_data.pop("image"))
+        instance.image = blob.name
+        instance.width, instance.height = blob.width, blob.height
+        instance.blob = blob
+        instance = super().update(instance, validated_data)
+        name = release_blob(previous_blob) if previous_blob else previous_name
+        if name and name != blob.name:
+            transaction.on_commit(lambda: delete_files(name))
+        return instance
+
+
+class AnnotationListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data: list[AnnotationDict]) -> list[AnnotationFlatDict]:
+        if not isinstance(data, list):
+            raise serializers.ValidationError(
+                {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        self.error_messages["not_a_list"].format(
+                            input_type=type(data).__name__
+                        )
+                    ]
+                }
+            )
+        return validate_annotations(data)
+
+    @property
+    def data(self) -> ReturnList:
+        with span("serialize"):
+            return super().data
+
+    def create(self, validated_data: list[AnnotationFlatDict]) -> list[Annotation]:
+        instances, self.context["tree"] = bulk_create_forest(validated_data)
+        invalidate_trees(instance.path for instance in instances)
+        return instances
+
+
+class AnnotationMoveSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    parent = serializers.UUIDField(allow_null=True)
 
 
 class AnnotationSerializer(serializers.ModelSerializer):
@@ -44,102 +127,116 @@ class AnnotationSerializer(serializers.ModelSerializer):
             "surface",
             "parent",
         ]
+        list_serializer_class = AnnotationListSerializer
+
+    @property
+    def data(self) -> ReturnDict | ReturnList:
+        with span("serialize"):
+            data = serializers.BaseSerializer.data.fget(self)
+        if isinstance(data, list):
+            return ReturnList(data, serializer=self)
+        return ReturnDict(data, serializer=self)
 
     def _exclude_none(self, data: dict) -> dict:
         return {k: v for k, v in data.items() if v is not None}
 
+    @transaction.atomic
     def create(self, validated_data) -> Annotation:
         parent = validated_data.pop("parent", None)
         image = validated_data.pop("image", None)
         if parent:
-            parent = Annotation.objects.get(pk=parent)
-            child = parent.add_child(**validated_data)
+            parent = Annotation.objects.select_for_update().get(pk=parent)
+            try:
+                child = parent.add_child(image_id=parent.image_id, **validated_data)
+            except PathOverflow:
+                raise path_overflow(parent.path)
+            invalidate_trees([child.path])
             return child
-        instance = Annotation.add_root(**validated_data)
-        if image:
-            instance.image = image
-            instance.save(update_fields=["image"])
+        lock_roots()
+        try:
+            instance = Annotation.add_root(image=image, **validated_data)
+        except PathOverflow:
+            raise path_overflow("")
+        invalidate_trees([instance.path])
         return instance
 
+    @transaction.atomic
     def update(
         self, instance: Annotation, validated_data: AnnotationFlatDict
     ) -> Annotation:
         parent = validated_data.pop("parent", None)
+        invalidate_trees([instance.path])
         if parent:
-            parent = Annotation.objects.get(pk=parent)
-            instance.move(parent, pos="last-child")
+            for moved in bulk_move([(instance.pk, parent)]):
+                instance.path, instance.depth = moved.path, moved.depth
+                instance.image_id = moved.image_id
         for key, value in validated_data.items():
             setattr(instance, key, value)
         instance.save(update_fields=[k for k in validated_data.keys() if k != "id"])
         return instance
 
     def to_internal_value(self, data: AnnotationDict) -> AnnotationFlatDict:
-        data_new: AnnotationFlatDict = {
-            "id": data["id"],
-            "image": data.get("image", None),
-            "class_id": data["class_id"],
-            "start_x": data["shape"]["start_x"],
-            "start_y": data["shape"]["start_y"],
-            "end_x": data["shape"]["end_x"],
-            "end_y": data["shape"]["end_y"],
-            "confirmed": data["meta"]["confirmed"],
-            "confidence_percent": data["meta"]["confidence_percent"],
-            "tags": data.get("tags", None),
-            "surface": data.get("surface", None),
-            "parent": data["relations"][0]["label_id"]
-            if data.get("relations", None)
-            else None,
-        }
-        return super().to_internal_value(self._exclude_none(data_new))
+        return validate_annotation(data)
 
     def to_representation(
         self, instance: Annotation
+    ) -> list[AnnotationDict] | AnnotationExternalDict:
+        tree = self.context.get("tree")
+        if tree is None or instance not in tree:
+            tree = AnnotationTree.load(instance)
+        return self._represent(instance, tree)
+
+    def _represent(
+        self, instance: Annotation, tree: AnnotationTree
     ) -> list[AnnotationDict] | AnnotationExternalDict:
         if not instance.confirmed:
-            return [
-                self._exclude_none(
-                    {
-                        "id": str(instance.pk),
-                        "class_id": cast(Literal["tooth", "caries"], instance.class_id),
-                        "shape": {
-                            "start_x": instance.start_x,
-                            "start_y": instance.start_y,
-                            "end_x": instance.end_x,
-                            "end_y": instance.end_y,
-                        },
-                        "relations": [
-                            {"type": "child", "label_id": str(instance.get_parent().pk)}
-                        ]
-                        if instance.get_parent()
-                        else None,
-                        "tags": cast(Optional[list[str]], instance.tags),
-                        "surface": cast(Optional[list[str]], instance.surface),
-                        "meta": {
-                            "confirmed": instance.confirmed,
-                            "confidence_percent": instance.confidence_percent,
-                        },
-                    }
-                )
-                for instance in Annotation.get_tree(instance)
-            ]
-        else:
-            return self._exclude_none(
-                {
-                    "id": str(instance.pk),
-                    "kind": cast(Literal["tooth", "caries"], instance.class_id),
-                    "shape": {
-                        "x": [instance.start_x, instance.end_x],
-                        "y": [instance.start_y, instance.end_y],
-                    },
-                    "number": cast(Optional[str], instance.tags[0])
-                    if instance.tags
-                    else None,
-                    "surface": "".join(instance.surface) if instance.surface else None,
-                    "children": [
-                        self.to_representation(child)
-                        for child in instance.get_children()
-                    ]
-                    if instance.get_children()
-                    else None,
-                }
-            )
+            return [self._to_flat(node, tree) for node in tree.iter_subtree(instance)]
+        children = tree.get_children(instance)
+        return self._exclude_none(
+            {
+                "id": str(instance.pk),
+                "kind": cast(Literal["tooth", "caries"], instance.class_id),
+                "shape": {
+                    "x": [instance.start_x, instance.end_x],
+                    "y": [instance.start_y, instance.end_y],
+                },
+                "number": cast(Optional[str], instance.tags[0])
+                if instance.tags
+                else None,
+                "surface": "".join(instance.surface) if instance.surface else None,
+                "children": [self._represent(child, tree) for child in children]
+                if children
+                else None,
+            }
+        )
+
+    def to_flat_representation(
+        self, instances: list[Annotation]
+    ) -> list[AnnotationDict]:
+        with span("serialize"):
+            tree = AnnotationTree.with_parents(instances)
+            return [self._to_flat(instance, tree) for instance in instances]
+
+    def _to_flat(self, instance: Annotation, tree: AnnotationTree) -> AnnotationDict:
+        parent = tree.get_parent(instance)
+        return self._exclude_none(
+            {
+                "id": str(instance.pk),
+                "class_id": cast(Literal["tooth", "caries"], instance.class_id),
+                "shape": {
+                    "start_x": instance.start_x,
+                    "start_y": instance.start_y,
+                    "end_x": instance.end_x,
+                    "end_y": instance.end_y,
+                },
+                "relations": [{"type": "child", "label_id": str(parent.pk)}]
+                if parent
+                else None,
+                "tags": cast(Optional[list[str]], instance.tags),
+                "surface": cast(Optional[list[str]], instance.surface),
+                "meta": {
+                    "confirmed": instance.confirmed,
+                    "confidence_percent": instance.confidence_percent,
+                },
+            }
+        )
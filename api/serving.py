@@ -0,0 +1,106 @@
+import hashlib
+import mimetypes
+import re
+from datetime import datetime
+from typing import IO, Iterator, Optional
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBase,
+    StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _iter_range(file: IO[bytes], start: int, length: int) -> Iterator[bytes]:
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def _if_range_matches(request: HttpRequest, etag: str, last_modified: int) -> bool:
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_file(request: HttpRequest, name: str, modified: datetime) -> HttpResponseBase:
+    last_modified = int(modified.timestamp())
+    etag = '"%s"' % hashlib.md5(f"{name}:{modified.isoformat()}".encode()).hexdigest()
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, name, etag, last_modified)
+    response.headers.setdefault("ETag", etag)
+    response.headers.setdefault("Last-Modified", http_date(last_modified))
+    return response
+
+
+def _file_response(
+    request: HttpRequest, name: str, etag: str, last_modified: int
+) -> HttpResponseBase:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    backend = settings.IMAGE_SENDFILE_BACKEND
+    if backend == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.IMAGE_SENDFILE_ROOT + quote(name)
+        return response
+    if backend == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = default_storage.path(name)
+        return response
+
+    size = default_storage.size(name)
+    byte_range = None
+    if "Range" in request.headers and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.headers["Range"], size)
+        if byte_range and byte_range[0] >= size:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+    if byte_range is None or byte_range == (0, size - 1):
+        response = FileResponse(
+            default_storage.open(name, "rb"), content_type=content_type
+        )
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _iter_range(default_storage.open(name, "rb"), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,72 @@
+from itertools import islice
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.routers import read_database, reading_from
+
+STREAM_CHUNK_SIZE = 500
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def wants_stream(request: Request) -> bool:
+    return request.query_params.get("stream", "").lower() in ("1", "true", "yes")
+
+
+def is_asgi(request: Request) -> bool:
+    return isinstance(request._request, ASGIRequest)
+
+
+def iter_json_list(items: Iterable[Any]) -> Iterator[bytes]:
+    encoder = JSONEncoder()
+    yield b"["
+    for i, item in enumerate(items):
+        if i:
+            yield b","
+        yield encoder.encode(item).encode()
+    yield b"]"
+
+
+def _routed(chunks: Iterator[bytes], alias: Optional[str]) -> Iterator[bytes]:
+    # The body is produced after the view returned, outside its database routing.
+    while True:
+        with reading_from(alias):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def aiter_chunks(
+    chunks: Iterator[bytes], size: int = STREAM_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    # Under ASGI a sync iterator would be read into a list before sending. Pulling
+    # batches through sync_to_async keeps the response streamed and the reads on
+    # the request's thread, where the server-side cursor lives.
+    pull = sync_to_async(lambda: b"".join(islice(chunks, size)))
+    while chunk := await pull():
+        yield chunk
+
+
+def streaming_json_response(
+    items: Iterable[Any], asynchronous: bool = False
+) -> StreamingHttpResponse:
+    content = _routed(iter_json_list(items), read_database())
+    return StreamingHttpResponse(
+        aiter_chunks(content) if asynchronous else content,
+        content_type="application/json",
+    )
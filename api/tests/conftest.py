@@ -0,0 +1,40 @@
+import io
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.files.images import ImageFile
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from api.models import Image
+
+REPLICAS = list(django_settings.DATABASE_REPLICAS)
+
+
+@pytest.fixture(autouse=True)
+def primary_only(settings):
+    # Replica connections cannot see the uncommitted data of transactional tests,
+    # so reads stay on the primary unless a test asks for the replicas.
+    settings.DATABASE_REPLICAS = []
+
+
+@pytest.fixture
+def replicas(settings) -> list[str]:
+    settings.DATABASE_REPLICAS = REPLICAS[:1]
+    return settings.DATABASE_REPLICAS
+
+
+@pytest.fixture
+def client() -> APIClient:
+    return APIClient()
+
+
+@pytest.fixture
+def image() -> Image:
+    file = io.BytesIO()
+    PILImage.new("RGBA", size=(64, 64), color=(256, 0, 0)).save(file, "png")
+    file.name = "test.png"
+    file.seek(0)
+    instance = Image.objects.create(image=ImageFile(file))
+    yield instance
+    instance.image.delete(save=False)
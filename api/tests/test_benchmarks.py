@@ -0,0 +1,199 @@
+import json
+import os
+import statistics
+import time
+import uuid
+from typing import Callable, Optional
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.cache import annotation_cache
+from api.models import Image, Annotation
+from api.serializers import AnnotationSerializer
+from api.type_defs import AnnotationDict
+
+# Run with BENCHMARK_RESULTS=results.json to keep the timings for comparison across
+# commits; the query budgets are asserted on every run.
+BENCHMARK_REPEAT = int(os.environ.get("BENCHMARK_REPEAT", 3))
+SIZES = [
+    pytest.param(4, 2, id="4x2"),
+    pytest.param(32, 3, id="32x3"),
+    pytest.param(32, 5, id="32x5"),
+]
+
+
+@pytest.fixture(scope="module")
+def results() -> list[dict]:
+    collected: list[dict] = []
+    yield collected
+    path = os.environ.get("BENCHMARK_RESULTS")
+    if path:
+        with open(path, "w") as file:
+            json.dump({"results": collected}, file, indent=2)
+
+
+def forest(
+    teeth: int, depth: int, image: Optional[Image] = None
+) -> list[AnnotationDict]:
+    # Each tooth carries a binary tree of caries, `depth` levels including the tooth.
+    items: list[AnnotationDict] = []
+
+    def add(parent: Optional[str], level: int, number: int) -> None:
+        item: AnnotationDict = {
+            "id": str(uuid.uuid4()),
+            "class_id": "caries" if parent else "tooth",
+            "shape": {"start_x": 0, "start_y": 0, "end_x": 10, "end_y": 10},
+            "meta": {"confirmed": number % 2 == 0, "confidence_percent": 0.9},
+        }
+        if parent:
+            item["relations"] = [{"type": "child", "label_id": parent}]
+            item["surface"] = ["B"]
+        else:
+            item["tags"] = [str(number)]
+            if image:
+                item["image"] = str(image.pk)
+        items.append(item)
+        if level < depth:
+            add(item["id"], level + 1, number)
+            add(item["id"], level + 1, number)
+
+    for number in range(teeth):
+        add(None, 1, number)
+    return items
+
+
+def create_forest(image: Image, teeth: int, depth: int) -> list[Annotation]:
+    serializer = AnnotationSerializer(data=forest(teeth, depth, image), many=True)
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def measure(
+    results: list[dict],
+    name: str,
+    params: dict,
+    budget: int,
+    run: Callable[[], object],
+    setup: Callable[[], object] = lambda: None,
+) -> None:
+    timings, counts = [], []
+    for _ in range(BENCHMARK_REPEAT):
+        setup()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        counts.append(len(queries))
+    results.append(
+        {
+            "name": name,
+            "params": params,
+            "queries": max(counts),
+            "budget": budget,
+            "min": min(timings),
+            "median": statistics.median(timings),
+        }
+    )
+    assert max(counts) <= budget, f"{name} {params}: {max(counts)} queries"
+
+
+def clear_cache() -> None:
+    annotation_cache.backend.clear()
+    annotation_cache._local.clear()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("teeth,depth", SIZES)
+class TestBenchmarks:
+    def test_to_internal_value(self, results, image: Image, teeth: int, depth: int):
+        data = forest(teeth, depth, image)
+
+        measure(
+            results,
+            "AnnotationSerializer.to_internal_value",
+            {"teeth": teeth, "depth": depth, "nodes": len(data)},
+            1,
+            lambda: AnnotationSerializer(data=data, many=True).is_valid(
+                raise_exception=True
+            ),
+        )
+
+    def test_to_representation(self, results, image: Image, teeth: int, depth: int):
+        roots = [node for node in create_forest(image, teeth, depth) if node.is_root()]
+
+        measure(
+            results,
+            "AnnotationSerializer.to_representation",
+            {"teeth": teeth, "depth": depth},
+            teeth,
+            lambda: [AnnotationSerializer(root).data for root in roots],
+        )
+
+    def test_image_annotations_get(
+        self, results, client: APIClient, image: Image, teeth: int, depth: int
+    ):
+        create_forest(image, teeth, depth)
+        url = f"/api/images/{image.pk}/annotations/"
+        params = {"teeth": teeth, "depth": depth}
+
+        measure(
+            results,
+            "ImageAnnotationView.get",
+            params,
+            1,
+            lambda: client.get(url),
+            clear_cache,
+        )
+        measure(
+            results,
+            "ImageAnnotationView.get[cached]",
+            params,
+            0,
+            lambda: client.get(url),
+        )
+        measure(
+            results,
+            "ImageAnnotationView.get[columnar]",
+            params,
+            1,
+            lambda: client.get(url, {"format": "columnar"}),
+            clear_cache,
+        )
+        measure(
+            results,
+            "ImageAnnotationView.get[stream]",
+            params,
+            2,
+            lambda: b"".join(client.get(url, {"stream": "1"}).streaming_content),
+        )
+
+    def test_image_annotations_post(
+        self, results, client: APIClient, image: Image, teeth: int, depth: int
+    ):
+        url = f"/api/images/{image.pk}/annotations/"
+
+        measure(
+            results,
+            "ImageAnnotationView.post",
+            {"teeth": teeth, "depth": depth},
+            8,
+            lambda: client.post(url, forest(teeth, depth), format="json"),
+        )
+
+    def test_annotation_detail_get(
+        self, results, client: APIClient, image: Image, teeth: int, depth: int
+    ):
+        root = create_forest(image, teeth, depth)[0]
+        url = f"/api/annotations/{root.pk}/"
+
+        measure(
+            results,
+            "AnnotationDetailView.get",
+            {"teeth": teeth, "depth": depth},
+            2,
+            lambda: client.get(url),
+            clear_cache,
+        )
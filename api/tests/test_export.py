@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+
+from api.models import Annotation, Image
+
+
+@pytest.mark.django_db
+def test_export_dataset(tmp_path, settings):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    (tmp_path / "media" / "images").mkdir(parents=True)
+    images = []
+    for i in range(3):
+        (tmp_path / "media" / "images" / f"{i}.png").write_bytes(b"png")
+        images.append(
+            Image.objects.create(image=f"images/{i}.png", width=64, height=32)
+        )
+    tooth = Annotation.add_root(
+        image=images[0],
+        class_id="tooth",
+        start_x=10,
+        start_y=20,
+        end_x=0,
+        end_y=0,
+        tags=["48"],
+        confidence_percent=0.9,
+    )
+    caries = tooth.add_child(
+        image=images[0],
+        class_id="caries",
+        start_x=1,
+        start_y=1,
+        end_x=3,
+        end_y=4,
+        surface=["B", "O"],
+        confidence_percent=0.8,
+    )
+    output = tmp_path / "export"
+
+    call_command(
+        "export_dataset",
+        str(output),
+        shard_size=2,
+        workers=0,
+        copy_images=True,
+        stdout=io.StringIO(),
+    )
+
+    lines = [
+        json.loads(line)
+        for name in ("annotations-00000.jsonl", "annotations-00001.jsonl")
+        for line in (output / name).read_text().splitlines()
+    ]
+    assert [line["image"]["id"] for line in lines] == [
+        str(image.pk) for image in images
+    ]
+    assert [item["id"] for item in lines[0]["annotations"]] == [
+        str(tooth.pk),
+        str(caries.pk),
+    ]
+    assert lines[0]["annotations"][1]["relations"][0]["label_id"] == str(tooth.pk)
+    assert lines[1]["annotations"] == []
+
+    coco = json.loads((output / "annotations-00000.coco.json").read_text())
+    assert [category["name"] for category in coco["categories"]] == ["tooth", "caries"]
+    assert coco["annotations"][0]["bbox"] == [0, 0, 10, 20]
+    assert coco["annotations"][1]["attributes"]["parent_id"] == str(tooth.pk)
+    assert coco["annotations"][1]["image_id"] == str(images[0].pk)
+    assert (output / "images" / "2.png").read_bytes() == b"png"
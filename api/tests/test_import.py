@@ -0,0 +1,92 @@
+import io
+import json
+import uuid
+
+import pytest
+from django.core.management import call_command
+
+from api.models import Annotation, Image
+
+
+def _annotation(pk, class_id="tooth", parent=None):
+    annotation = {
+        "id": str(pk),
+        "class_id": class_id,
+        "shape": {"start_x": 1, "start_y": 2, "end_x": 3, "end_y": 4},
+        "meta": {"confirmed": False, "confidence_percent": 0.5},
+        "tags": ['4"8'],
+    }
+    if parent:
+        annotation["relations"] = [{"type": "child", "label_id": str(parent)}]
+    return annotation
+
+
+def _line(image_id, annotations):
+    image = {"file_name": f"images/{image_id}.png", "width": 64, "height": 32}
+    if image_id:
+        image["id"] = str(image_id)
+    return json.dumps({"image": image, "annotations": annotations}) + "\n"
+
+
+@pytest.mark.django_db
+def test_import_annotations_resumes_from_checkpoint(tmp_path):
+    first, second = uuid.uuid4(), uuid.uuid4()
+    tooth, caries, other = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    source = tmp_path / "annotations.jsonl"
+    source.write_text(
+        _line(
+            first,
+            [_annotation(tooth), _annotation(caries, "caries", parent=tooth)],
+        )
+        + "not json\n"
+        + _line(None, [_annotation(uuid.uuid4(), parent=uuid.uuid4())])
+        + _line(second, [_annotation(other)])
+    )
+    stderr = io.StringIO()
+
+    call_command(
+        "import_annotations",
+        str(source),
+        batch_size=1,
+        stdout=io.StringIO(),
+        stderr=stderr,
+    )
+
+    assert set(Image.objects.values_list("pk", flat=True)) == {first, second}
+    assert "Line 2 skipped" in stderr.getvalue()
+    assert "Line 3 skipped" in stderr.getvalue()
+    root = Annotation.objects.get(pk=tooth)
+    child = Annotation.objects.get(pk=caries)
+    assert root.numchild == 1 and root.image_id == first
+    assert child.get_parent() == root and child.image_id == first
+    assert child.tags == ['4"8']
+    assert Annotation.objects.get(pk=other).is_sibling_of(root)
+    checkpoint = json.loads((tmp_path / "annotations.jsonl.checkpoint").read_text())
+    assert checkpoint == {
+        "offset": source.stat().st_size,
+        "line": 4,
+        "images": 2,
+        "annotations": 3,
+    }
+
+    third = uuid.uuid4()
+    with source.open("a") as file:
+        file.write(_line(third, [_annotation(uuid.uuid4())]))
+    call_command("import_annotations", str(source), stdout=io.StringIO())
+
+    assert Image.objects.filter(pk=third).exists()
+    assert Annotation.objects.count() == 4
+    assert Annotation.find_problems() == ([], [], [], [], [])
+
+
+@pytest.mark.django_db
+def test_import_annotations_skips_loaded_images(tmp_path):
+    source = tmp_path / "annotations.jsonl"
+    source.write_text(_line(None, [_annotation(uuid.uuid4())]))
+
+    call_command("import_annotations", str(source), stdout=io.StringIO())
+    (tmp_path / "annotations.jsonl.checkpoint").unlink()
+    call_command("import_annotations", str(source), stdout=io.StringIO())
+
+    assert Image.objects.count() == 1
+    assert Annotation.objects.count() == 1
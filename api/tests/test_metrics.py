@@ -0,0 +1,51 @@
+import pytest
+from rest_framework.test import APIClient
+
+from api import metrics
+from api.models import Image
+
+
+@pytest.fixture(autouse=True)
+def histograms():
+    for histogram in metrics.HISTOGRAMS:
+        histogram.clear()
+    yield metrics.HISTOGRAMS
+
+
+class TestInstrumentationMiddleware:
+    @pytest.mark.django_db
+    def test_server_timing_and_metrics(self, client: APIClient):
+        image = Image.objects.create(image="images/test.png", width=1, height=1)
+
+        response = client.get(f"/api/images/{image.pk}/annotations/")
+
+        timing = response["Server-Timing"]
+        assert timing.startswith('db;desc="1 queries";dur=')
+        assert "serialize;dur=" in timing
+        assert "total;dur=" in timing
+
+        body = client.get("/metrics/").content.decode()
+        labels = 'method="GET",route="api/images/<str:pk>/annotations/"'
+        assert f"http_request_duration_seconds_count{{{labels}}} 1" in body
+        assert f'http_request_db_queries_bucket{{{labels},le="1"}} 1' in body
+        assert f'http_request_db_queries_bucket{{{labels},le="0"}} 0' in body
+        assert 'annotation_cache_requests_total{result="misses"}' in body
+        assert 'route="metrics/"' not in body
+
+
+class TestHistogram:
+    def test_collect(self):
+        histogram = metrics.Histogram("latency", "Latency.", (0.1, 1.0))
+        histogram.observe(0.05, route="a")
+        histogram.observe(0.5, route="a")
+        histogram.observe(5, route="a")
+
+        assert list(histogram.collect()) == [
+            "# HELP latency Latency.",
+            "# TYPE latency histogram",
+            'latency_bucket{route="a",le="0.1"} 1',
+            'latency_bucket{route="a",le="1"} 2',
+            'latency_bucket{route="a",le="+Inf"} 3',
+            'latency_sum{route="a"} 5.55',
+            'latency_count{route="a"} 3',
+        ]
@@ -0,0 +1,97 @@
+import pytest
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.models import Image
+from api.routers import PRIMARY_COOKIE, ReplicaRouter, reading_from, replica_for
+
+
+class TestReplicaRouter:
+    def test_replica_for(self, settings):
+        settings.DATABASE_REPLICAS = ["replica1"]
+        factory = RequestFactory()
+
+        assert replica_for(factory.get("/api/images/")) == "replica1"
+        assert replica_for(factory.post("/api/images/")) is None
+        factory.cookies[PRIMARY_COOKIE] = "1"
+        assert replica_for(factory.get("/api/images/")) is None
+
+    def test_replica_for_without_replicas(self, settings):
+        settings.DATABASE_REPLICAS = []
+
+        assert replica_for(RequestFactory().get("/api/images/")) is None
+
+    def test_routing(self):
+        router = ReplicaRouter()
+
+        assert router.db_for_read(Image) is None
+        with reading_from("replica1"):
+            assert router.db_for_read(Image) == "replica1"
+            assert router.db_for_write(Image) == "default"
+        assert router.db_for_read(Image) is None
+
+    @pytest.mark.django_db
+    def test_writes_stick_client_to_primary(self, client: APIClient):
+        image = Image.objects.create(image="images/test.png", width=1, height=1)
+
+        response = client.post("/api/annotations/move/", [], format="json")
+        assert response.cookies[PRIMARY_COOKIE]["max-age"] == (
+            settings.REPLICA_STICKY_SECONDS
+        )
+
+        response = client.get(f"/api/images/{image.pk}/annotations/")
+        assert PRIMARY_COOKIE not in response.cookies
+
+
+@pytest.mark.skipif(
+    not settings.DATABASE_REPLICAS, reason="set DB_REPLICA_HOSTS to test replicas"
+)
+@pytest.mark.django_db(transaction=True, databases="__all__")
+def test_reads_go_to_replica(client: APIClient, replicas: list[str]):
+    (replica,) = replicas
+    image = Image.objects.create(image="images/test.png", width=1, height=1)
+
+    with CaptureQueriesContext(connections["default"]) as primary_queries:
+        with CaptureQueriesContext(connections[replica]) as replica_queries:
+            response = client.get(
+                f"/api/images/{image.pk}/annotations/", {"stream": "1"}
+            )
+            assert b"".join(response.streaming_content) == b"[]"
+            assert client.get(f"/api/images/{image.pk}/").status_code == 200
+    assert len(primary_queries) == 0
+    assert len(replica_queries) == 2
+
+    client.cookies[PRIMARY_COOKIE] = "1"
+    with CaptureQueriesContext(connections["default"]) as primary_queries:
+        assert client.get(f"/api/images/{image.pk}/").status_code == 200
+    assert len(primary_queries) == 1
+
+
+@pytest.mark.skipif(
+    not settings.DATABASE_REPLICAS, reason="set DB_REPLICA_HOSTS to test replicas"
+)
+@pytest.mark.django_db(transaction=True, databases="__all__")
+def test_cache_misses_build_on_caught_up_replica(
+    client: APIClient, replicas: list[str], monkeypatch
+):
+    (replica,) = replicas
+    image = Image.objects.create(image="images/test.png", width=1, height=1)
+    url = f"/api/images/{image.pk}/annotations/"
+
+    with CaptureQueriesContext(connections["default"]) as primary_queries:
+        with CaptureQueriesContext(connections[replica]) as replica_queries:
+            assert client.get(url).json() == []
+            assert client.get(url, {"class_id": "tooth"}).json() == []
+    # The primary's WAL position is read once per cache version.
+    assert [query["sql"] for query in primary_queries] == [
+        "SELECT pg_current_wal_lsn()"
+    ]
+    assert len(replica_queries) == 4
+
+    monkeypatch.setattr("api.cache.has_replayed", lambda alias, lsn: False)
+    with CaptureQueriesContext(connections[replica]) as replica_queries:
+        assert client.get(url, {"class_id": "caries"}).json() == []
+    assert len(replica_queries) == 0
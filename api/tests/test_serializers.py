@@ -8,6 +8,7 @@ from PIL import Image as PILImage
 
 from api.models import Image, Annotation
 from api.serializers import ImageSerializer, AnnotationSerializer
+from api.trees import AnnotationTree
 from api.type_defs import AnnotationDict, AnnotationExternalDict, AnnotationFlatDict
 
 
@@ -317,3 +318,96 @@ class TestAnnotationSerializer:
         assert instance.tags == ["49"]
 
         instance.delete()
+
+    @pytest.mark.django_db
+    def test_annotation_external_tree_serialization_queries(
+        self, annotation_external_with_child: Annotation, django_assert_num_queries
+    ):
+        child = annotation_external_with_child.get_children()[0]
+        for _ in range(3):
+            child.add_child(
+                class_id="caries",
+                start_x=0,
+                start_y=0,
+                end_x=1,
+                end_y=1,
+                confirmed=True,
+                confidence_percent=0.9,
+            )
+        root = Annotation.objects.get(pk=annotation_external_with_child.pk)
+
+        with django_assert_num_queries(1):
+            data: AnnotationExternalDict = AnnotationSerializer(instance=root).data
+
+        assert len(data["children"]) == 1
+        assert len(data["children"][0]["children"]) == 3
+
+    @pytest.mark.django_db
+    def test_annotation_subtree_flat_serialization_queries(
+        self, annotation_with_child: Annotation, django_assert_num_queries
+    ):
+        child = Annotation.objects.get(pk=annotation_with_child.get_children()[0].pk)
+        child.add_child(
+            class_id="caries",
+            start_x=0,
+            start_y=0,
+            end_x=1,
+            end_y=1,
+            confirmed=False,
+            confidence_percent=0.9,
+        )
+        child.refresh_from_db()
+
+        with django_assert_num_queries(1):
+            data = AnnotationSerializer().to_representation(child)
+
+        assert data[0]["id"] == str(child.pk)
+        assert data[0]["relations"][0]["label_id"] == str(annotation_with_child.pk)
+        assert data[1]["relations"][0]["label_id"] == str(child.pk)
+
+    @pytest.mark.django_db
+    def test_annotations_deserialization_errors(self, annotation_dict: AnnotationDict):
+        invalid = {
+            "id": "not-a-uuid",
+            "class_id": "implant",
+            "shape": {"start_x": "a", "start_y": 0, "end_x": 10},
+            "tags": ["48", "x" * 21],
+            "relations": [{"type": "child", "label_id": str(uuid.uuid4())}],
+            "image": str(uuid.uuid4()),
+        }
+        serializer = AnnotationSerializer(data=[annotation_dict, invalid], many=True)
+
+        assert not serializer.is_valid()
+        assert serializer.errors[0] == {}
+        assert serializer.errors[1] == {
+            "id": ["Must be a valid UUID."],
+            "class_id": ['"implant" is not a valid choice.'],
+            "shape": {
+                "start_x": ["A valid integer is required."],
+                "end_y": ["This field is required."],
+            },
+            "tags": {1: ["Ensure this field has no more than 20 characters."]},
+            "meta": ["This field is required."],
+        }
+
+    @pytest.mark.django_db
+    def test_annotations_deserialization_appends_siblings(
+        self, annotation: Annotation, annotation_dict: AnnotationDict
+    ):
+        path = annotation.path
+        annotation_dict["class_id"] = "caries"
+        serializer = AnnotationSerializer(data=[annotation_dict], many=True)
+        serializer.is_valid()
+        instances: list[Annotation] = serializer.save()
+
+        annotation.refresh_from_db()
+        assert annotation.path == path
+        assert [node.pk for node in Annotation.get_root_nodes()] == [
+            annotation.pk,
+            instances[0].pk,
+        ]
+        tree = AnnotationTree(Annotation.get_root_nodes())
+        assert [node.pk for node in tree.get_roots()] == [
+            instances[0].pk,
+            annotation.pk,
+        ]
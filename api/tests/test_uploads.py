@@ -0,0 +1,49 @@
+import hashlib
+import io
+
+import pytest
+from django.test import RequestFactory
+from PIL import Image as PILImage
+
+from api.uploads import HashingUploadHandler, parse_image_size
+
+
+def encode(format: str, size: tuple[int, int] = (123, 45), **params) -> bytes:
+    file = io.BytesIO()
+    PILImage.new("RGB", size=size).save(file, format, **params)
+    return file.getvalue()
+
+
+class TestParseImageSize:
+    @pytest.mark.parametrize(
+        "format,params",
+        [
+            ("png", {}),
+            ("gif", {}),
+            ("bmp", {}),
+            ("jpeg", {}),
+            ("jpeg", {"progressive": True}),
+            ("webp", {}),
+            ("webp", {"lossless": True}),
+        ],
+    )
+    def test_parse_image_size(self, format: str, params: dict):
+        assert tuple(parse_image_size(encode(format, **params))) == (123, 45)
+
+    def test_parse_image_size_unknown(self):
+        assert parse_image_size(b"not an image") is None
+
+
+class TestHashingUploadHandler:
+    def test_upload_handler(self):
+        data = encode("png", size=(300, 200))
+        handler = HashingUploadHandler(RequestFactory().post("/"))
+        handler.new_file("image", "scan.png", "image/png", len(data))
+        for start in range(0, len(data), 100):
+            handler.receive_data_chunk(data[start : start + 100], start)
+        file = handler.file_complete(len(data))
+
+        assert file.sha256 == hashlib.sha256(data).hexdigest()
+        assert tuple(file.image_size) == (300, 200)
+        assert file.read() == data
+        file.close()
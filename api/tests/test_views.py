@@ -0,0 +1,918 @@
+import hashlib
+import io
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import AsyncClient
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from api import derivatives
+from api.columnar import decode
+from api.models import Image, ImageBlob, Annotation
+from api.renderers import ColumnarRenderer
+
+
+def add_tooth(image: Image, number: str, confirmed: bool = False) -> Annotation:
+    root = Annotation.add_root(
+        class_id="tooth",
+        start_x=0,
+        start_y=0,
+        end_x=10,
+        end_y=10,
+        tags=[number],
+        confirmed=confirmed,
+        confidence_percent=0.9,
+    )
+    root.image = image
+    root.save(update_fields=["image"])
+    return root
+
+
+def add_caries(parent: Annotation, confirmed: bool = False) -> Annotation:
+    return parent.add_child(
+        image_id=parent.image_id,
+        class_id="caries",
+        start_x=2,
+        start_y=2,
+        end_x=5,
+        end_y=5,
+        surface=["B"],
+        confirmed=confirmed,
+        confidence_percent=0.85,
+    )
+
+
+class TestImageViewSet:
+    @pytest.mark.django_db
+    def test_list_images_stream(self, client: APIClient, image: Image):
+        response = client.get("/api/images/", {"stream": "1"})
+
+        data = json.loads(b"".join(response.streaming_content))
+        assert [item["id"] for item in data] == [str(image.pk)]
+        assert data[0]["width"] == 64
+
+    @pytest.mark.django_db
+    def test_list_images_stream_asgi(self, image: Image):
+        async def fetch():
+            response = await AsyncClient().get("/api/images/", {"stream": "1"})
+            # A sync iterator would be read into memory before sending under ASGI.
+            assert response.is_async
+            return b"".join([part async for part in response.streaming_content])
+
+        data = json.loads(async_to_sync(fetch)())
+        assert [item["id"] for item in data] == [str(image.pk)]
+
+    @pytest.mark.django_db
+    def test_list_images_keyset_pagination(self, client: APIClient):
+        for i in range(5):
+            Image.objects.create(image=f"images/{i}.png", width=1, height=1)
+        Image.objects.filter(image__in=["images/1.png", "images/2.png"]).update(
+            created_at=Image.objects.get(image="images/1.png").created_at
+        )
+        expected = [
+            str(pk)
+            for pk in Image.objects.order_by("created_at", "id").values_list(
+                "pk", flat=True
+            )
+        ]
+
+        ids, url = [], "/api/images/?page_size=2"
+        while url:
+            data = client.get(url).json()
+            assert len(data["results"]) <= 2
+            ids.extend(item["id"] for item in data["results"])
+            url = data["next"]
+
+        assert ids == expected
+
+    @pytest.mark.django_db
+    def test_create_image_generates_derivatives(
+        self, client: APIClient, settings, tmp_path, django_capture_on_commit_callbacks
+    ):
+        settings.MEDIA_ROOT = tmp_path
+        settings.IMAGE_DERIVATIVE_WORKERS = 0
+        file = io.BytesIO()
+        PILImage.new("RGB", size=(600, 300)).save(file, "png")
+        file.name = "scan.png"
+        file.seek(0)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            image = client.post("/api/images/", {"image": file}).json()
+
+        tiles = client.get(f"/api/images/{image['id']}/tiles/").json()
+        assert tiles == {"width": 600, "height": 300, "tile_size": 256, "levels": 11}
+        thumbnail = client.get(f"/api/images/{image['id']}/thumbnail/")
+        assert PILImage.open(
+            io.BytesIO(b"".join(thumbnail.streaming_content))
+        ).size == (
+            256,
+            128,
+        )
+        tile = client.get(f"/api/images/{image['id']}/tiles/10/2_1/")
+        assert PILImage.open(io.BytesIO(b"".join(tile.streaming_content))).size == (
+            88,
+            44,
+        )
+        assert client.get(f"/api/images/{image['id']}/tiles/10/3_0/").status_code == 404
+
+    @pytest.mark.parametrize(
+        "mode, tile_mode", [("P", "RGBA"), ("1", "L"), ("I;16", "I;16")]
+    )
+    @pytest.mark.django_db
+    def test_create_image_derivatives_converts_modes(
+        self,
+        client: APIClient,
+        settings,
+        tmp_path,
+        django_capture_on_commit_callbacks,
+        mode: str,
+        tile_mode: str,
+    ):
+        settings.MEDIA_ROOT = tmp_path
+        settings.IMAGE_DERIVATIVE_WORKERS = 0
+        file = io.BytesIO()
+        PILImage.new(mode, size=(300, 200), color=1).save(file, "png")
+        file.name = "scan.png"
+        file.seek(0)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            image = client.post("/api/images/", {"image": file}).json()
+
+        tiles = client.get(f"/api/images/{image['id']}/tiles/").json()
+        assert tiles["levels"] == 10
+        tile = client.get(f"/api/images/{image['id']}/tiles/0/0_0/")
+        tile = PILImage.open(io.BytesIO(b"".join(tile.streaming_content)))
+        assert (tile.mode, tile.size) == (tile_mode, (1, 1))
+
+    @pytest.mark.django_db
+    def test_create_image_deduplicates_uploads(
+        self, client: APIClient, settings, tmp_path, django_capture_on_commit_callbacks
+    ):
+        settings.MEDIA_ROOT = tmp_path
+        settings.IMAGE_DERIVATIVE_WORKERS = 0
+        file = io.BytesIO()
+        PILImage.new("RGB", size=(40, 30)).save(file, "png")
+
+        images = []
+        for name in ("scan.png", "again.png"):
+            upload = io.BytesIO(file.getvalue())
+            upload.name = name
+            with django_capture_on_commit_callbacks(execute=True) as callbacks:
+                images.append(client.post("/api/images/", {"image": upload}).json())
+        assert len(callbacks) == 0
+
+        first, second = (Image.objects.get(pk=image["id"]) for image in images)
+        assert first.pk != second.pk
+        assert first.image.name == second.image.name == "images/scan.png"
+        assert (second.width, second.height) == (40, 30)
+        blob = ImageBlob.objects.get()
+        assert blob.refcount == 2
+        assert blob.sha256 == hashlib.sha256(file.getvalue()).hexdigest()
+
+        client.delete(f"/api/images/{first.pk}/")
+        call_command("purge_deleted", stdout=io.StringIO())
+        assert ImageBlob.objects.get().refcount == 1
+        assert default_storage.exists("images/scan.png")
+
+        client.delete(f"/api/images/{second.pk}/")
+        call_command("purge_deleted", stdout=io.StringIO())
+        assert not ImageBlob.objects.exists()
+        assert not default_storage.exists("images/scan.png")
+
+    @pytest.mark.django_db
+    def test_failed_derivatives_are_logged_and_retried(
+        self,
+        client: APIClient,
+        settings,
+        tmp_path,
+        caplog,
+        monkeypatch,
+        django_capture_on_commit_callbacks,
+    ):
+        settings.MEDIA_ROOT = tmp_path
+        settings.IMAGE_DERIVATIVE_WORKERS = 1
+        executor = ThreadPoolExecutor(max_workers=1)
+        monkeypatch.setattr("api.derivatives._executor", executor)
+        render = derivatives.generate_derivatives
+        monkeypatch.setattr(
+            "api.derivatives.generate_derivatives", lambda source, target: 1 / 0
+        )
+        file = io.BytesIO()
+        PILImage.new("RGB", size=(40, 30)).save(file, "png")
+
+        def upload(name: str):
+            data = io.BytesIO(file.getvalue())
+            data.name = name
+            with django_capture_on_commit_callbacks(execute=True):
+                return client.post("/api/images/", {"image": data}).json()
+
+        first = upload("scan.png")
+        executor.submit(int).result()
+        executor.shutdown()
+        assert "Rendering derivatives of images/scan.png failed" in caplog.text
+        assert client.get(f"/api/images/{first['id']}/thumbnail/").status_code == 404
+
+        settings.IMAGE_DERIVATIVE_WORKERS = 0
+        monkeypatch.setattr("api.derivatives.generate_derivatives", render)
+        upload("again.png")
+        assert client.get(f"/api/images/{first['id']}/thumbnail/").status_code == 200
+
+    @pytest.mark.django_db
+    def test_update_image_swaps_blobs(
+        self, client: APIClient, settings, tmp_path, django_capture_on_commit_callbacks
+    ):
+        settings.MEDIA_ROOT = tmp_path
+        settings.IMAGE_DERIVATIVE_WORKERS = 0
+
+        def upload(name: str, size: tuple[int, int]) -> io.BytesIO:
+            file = io.BytesIO()
+            PILImage.new("RGB", size=size).save(file, "png")
+            file.name = name
+            file.seek(0)
+            return file
+
+        with django_capture_on_commit_callbacks(execute=True):
+            first = client.post("/api/images/", {"image": upload("a.png", (4, 4))})
+            second = client.post("/api/images/", {"image": upload("a.png", (4, 4))})
+        url = f"/api/images/{first.json()['id']}/"
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.put(url, {"image": upload("b.png", (8, 6))})
+
+        assert response.status_code == 200
+        assert (response.json()["width"], response.json()["height"]) == (8, 6)
+        image = Image.objects.get(pk=first.json()["id"])
+        assert image.image.name == image.blob.name == "images/b.png"
+        assert {blob.name: blob.refcount for blob in ImageBlob.objects.all()} == {
+            "images/a.png": 1,
+            "images/b.png": 1,
+        }
+        assert client.get(f"{url}thumbnail/").status_code == 200
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.put(
+                f"/api/images/{second.json()['id']}/",
+                {"image": upload("c.png", (8, 6))},
+            )
+
+        assert ImageBlob.objects.get().refcount == 2
+        assert not default_storage.exists("images/a.png")
+        assert default_storage.exists("images/b.png")
+
+    @pytest.mark.django_db
+    def test_create_image_rejects_non_images(self, client: APIClient):
+        file = io.BytesIO(b"not an image")
+        file.name = "scan.png"
+
+        response = client.post("/api/images/", {"image": file})
+
+        assert response.status_code == 400
+        assert "image" in response.json()
+
+    @pytest.mark.django_db
+    def test_image_file(self, client: APIClient, image: Image):
+        url = f"/api/images/{image.pk}/file/"
+        with image.image.open("rb") as file:
+            content = file.read()
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert b"".join(response.streaming_content) == content
+        assert response["Accept-Ranges"] == "bytes"
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+
+        response = client.get(url, HTTP_RANGE="bytes=10-19")
+        assert response.status_code == 206
+        assert response["Content-Range"] == f"bytes 10-19/{len(content)}"
+        assert b"".join(response.streaming_content) == content[10:20]
+
+        response = client.get(url, HTTP_RANGE="bytes=-5")
+        assert b"".join(response.streaming_content) == content[-5:]
+
+        response = client.get(url, HTTP_RANGE=f"bytes={len(content)}-")
+        assert response.status_code == 416
+
+    @pytest.mark.django_db
+    def test_image_file_x_accel_redirect(
+        self, client: APIClient, image: Image, settings
+    ):
+        settings.IMAGE_SENDFILE_BACKEND = "x-accel-redirect"
+
+        response = client.get(f"/api/images/{image.pk}/file/")
+
+        assert response["X-Accel-Redirect"] == f"/protected/{image.image.name}"
+        assert response.content == b""
+
+    @pytest.mark.django_db
+    def test_destroy_image_soft_deletes_and_purges(
+        self, client: APIClient, image: Image, django_capture_on_commit_callbacks
+    ):
+        tooth = add_tooth(image, "48")
+        add_caries(tooth)
+        add_caries(tooth)
+        assert client.get(f"/api/annotations/{tooth.pk}/").status_code == 200
+
+        with django_capture_on_commit_callbacks(execute=True):
+            assert client.delete(f"/api/images/{image.pk}/").status_code == 204
+
+        assert not Image.objects.filter(pk=image.pk).exists()
+        assert Image.all_objects.get(pk=image.pk).is_deleted
+        assert Annotation.objects.filter(image=image).count() == 3
+        assert client.get(f"/api/images/{image.pk}/").status_code == 404
+        assert client.get(f"/api/images/{image.pk}/annotations/").json() == []
+        assert client.get(f"/api/annotations/{tooth.pk}/").status_code == 404
+        for pk in (tooth.pk, uuid.uuid4()):
+            url = f"/api/annotations/{pk}/"
+            assert client.put(url, {}, format="json").status_code == 404
+            assert client.patch(url, {}, format="json").status_code == 404
+
+        call_command("purge_deleted", batch_size=2, stdout=io.StringIO())
+
+        assert not Image.all_objects.filter(pk=image.pk).exists()
+        assert not Annotation.objects.filter(image_id=image.pk).exists()
+        assert not default_storage.exists(image.image.name)
+
+
+class TestImageAnnotationView:
+    @pytest.mark.django_db
+    def test_get_image_annotations(
+        self, client: APIClient, image: Image, django_assert_num_queries
+    ):
+        first = add_tooth(image, "48")
+        add_caries(first)
+        add_caries(first)
+        second = add_tooth(image, "47", confirmed=True)
+        add_caries(second, confirmed=True)
+
+        with django_assert_num_queries(1):
+            response = client.get(f"/api/images/{image.pk}/annotations/")
+
+        data = response.json()
+        assert len(data) == 2
+        assert [item["id"] for item in data[0]] == [
+            str(node.pk) for node in Annotation.get_tree(first)
+        ]
+        assert data[1]["id"] == str(second.pk)
+        assert data[1]["children"][0]["kind"] == "caries"
+
+    @pytest.mark.django_db
+    def test_post_image_annotations_bulk(
+        self, client: APIClient, image: Image, django_assert_max_num_queries
+    ):
+        existing = add_tooth(image, "11")
+        teeth = [
+            {
+                "id": str(uuid.uuid4()),
+                "class_id": "tooth",
+                "shape": {"start_x": 0, "start_y": 0, "end_x": 10, "end_y": 10},
+                "tags": [str(number)],
+                "meta": {"confirmed": False, "confidence_percent": 0.9},
+            }
+            for number in range(31, 39)
+        ]
+        caries = [
+            {
+                "id": str(uuid.uuid4()),
+                "class_id": "caries",
+                "relations": [{"type": "child", "label_id": parent["id"]}],
+                "shape": {"start_x": 1, "start_y": 1, "end_x": 2, "end_y": 2},
+                "meta": {"confirmed": False, "confidence_percent": 0.8},
+            }
+            for parent in [*teeth, {"id": str(existing.pk)}]
+        ]
+
+        with django_assert_max_num_queries(10):
+            response = client.post(
+                f"/api/images/{image.pk}/annotations/",
+                list(reversed(caries + teeth)),
+                format="json",
+            )
+
+        assert response.status_code == 200
+        assert Annotation.find_problems() == ([], [], [], [], [])
+        existing.refresh_from_db()
+        assert existing.numchild == 1
+        for tooth in teeth:
+            node = Annotation.objects.get(pk=tooth["id"])
+            assert node.image_id == image.pk
+            assert node.numchild == 1
+            assert node.get_children()[0].class_id == "caries"
+            assert node.get_children()[0].image_id == image.pk
+
+    @pytest.mark.django_db
+    def test_get_image_annotations_cached(
+        self,
+        client: APIClient,
+        image: Image,
+        django_assert_num_queries,
+        django_capture_on_commit_callbacks,
+    ):
+        tooth = add_tooth(image, "48")
+        url = f"/api/images/{image.pk}/annotations/"
+        assert len(client.get(url).json()[0]) == 1
+
+        with django_assert_num_queries(0):
+            assert len(client.get(url).json()[0]) == 1
+        assert len(client.get(f"/api/annotations/{tooth.pk}/").json()) == 1
+        with django_assert_num_queries(0):
+            assert len(client.get(f"/api/annotations/{tooth.pk}/").json()) == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(
+                url,
+                {
+                    "id": str(uuid.uuid4()),
+                    "class_id": "caries",
+                    "relations": [{"type": "child", "label_id": str(tooth.pk)}],
+                    "shape": {"start_x": 1, "start_y": 1, "end_x": 2, "end_y": 2},
+                    "meta": {"confirmed": False, "confidence_percent": 0.8},
+                },
+                format="json",
+            )
+
+        assert len(client.get(url).json()[0]) == 2
+        assert len(client.get(f"/api/annotations/{tooth.pk}/").json()) == 2
+
+    @pytest.mark.django_db
+    def test_put_annotation_invalidates_cache(
+        self, client: APIClient, image: Image, django_capture_on_commit_callbacks
+    ):
+        first = add_tooth(image, "48")
+        second = add_tooth(image, "47")
+        caries = add_caries(first)
+        url = f"/api/images/{image.pk}/annotations/"
+        assert [len(tree) for tree in client.get(url).json()] == [2, 1]
+        assert len(client.get(f"/api/annotations/{second.pk}/").json()) == 1
+        assert client.get(f"/api/annotations/{caries.pk}/").json()[0]["shape"] == {
+            "start_x": 2,
+            "start_y": 2,
+            "end_x": 5,
+            "end_y": 5,
+        }
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.put(
+                f"/api/annotations/{caries.pk}/",
+                {
+                    "id": str(caries.pk),
+                    "class_id": "caries",
+                    "relations": [{"type": "child", "label_id": str(second.pk)}],
+                    "shape": {"start_x": 2, "start_y": 2, "end_x": 7, "end_y": 5},
+                    "meta": {"confirmed": False, "confidence_percent": 0.85},
+                },
+                format="json",
+            )
+
+        assert response.status_code == 200
+        data = client.get(url).json()
+        assert [len(tree) for tree in data] == [1, 2]
+        assert data[1][1]["shape"]["end_x"] == 7
+        assert len(client.get(f"/api/annotations/{second.pk}/").json()) == 2
+        detail = client.get(f"/api/annotations/{caries.pk}/").json()
+        assert detail[0]["shape"]["end_x"] == 7
+
+    @pytest.mark.django_db
+    def test_get_image_annotations_region(self, client: APIClient, image: Image):
+        tooth = add_tooth(image, "48")
+        caries = add_caries(tooth)
+        other = Annotation.add_root(
+            image=image,
+            class_id="tooth",
+            start_x=120,
+            start_y=120,
+            end_x=100,
+            end_y=100,
+            confidence_percent=0.9,
+        )
+        url = f"/api/images/{image.pk}/annotations/"
+
+        data = client.get(url, {"bbox": "3,3,4,4"}).json()
+        assert [item["id"] for item in data] == [str(tooth.pk), str(caries.pk)]
+        assert data[1]["relations"][0]["label_id"] == str(tooth.pk)
+
+        data = client.get(url, {"bbox": "90,90,110,200"}).json()
+        assert [item["id"] for item in data] == [str(other.pk)]
+
+        assert client.get(url, {"bbox": "1,2,3"}).status_code == 400
+
+    @pytest.mark.django_db
+    def test_get_image_annotations_filtered(self, client: APIClient, image: Image):
+        tooth = add_tooth(image, "48")
+        caries = add_caries(tooth)
+        add_caries(tooth, confirmed=True)
+        unlikely = add_caries(add_tooth(image, "47"))
+        Annotation.objects.filter(pk=unlikely.pk).update(confidence_percent=0.5)
+        url = f"/api/images/{image.pk}/annotations/"
+
+        data = client.get(
+            url,
+            {"class_id": "caries", "confirmed": "false", "min_confidence_percent": 0.8},
+        ).json()
+        assert [item["id"] for item in data] == [str(caries.pk)]
+        assert [item["id"] for item in client.get(url, {"tag": "48"}).json()] == [
+            str(tooth.pk)
+        ]
+        assert len(client.get(url, {"surface": "B", "confirmed": "1"}).json()) == 1
+        assert client.get(url, {"class_id": "implant"}).status_code == 400
+        assert client.get(url, {"confirmed": "maybe"}).status_code == 400
+
+    @pytest.mark.django_db
+    def test_get_image_annotations_columnar(self, client: APIClient, image: Image):
+        first = add_tooth(image, "48")
+        caries = add_caries(first)
+        second = add_tooth(image, "47", confirmed=True)
+        add_caries(second, confirmed=True)
+        url = f"/api/images/{image.pk}/annotations/"
+
+        response = client.get(url, HTTP_ACCEPT=ColumnarRenderer.media_type)
+
+        assert response["Content-Type"] == ColumnarRenderer.media_type
+        data = decode(response.content)
+        assert data["count"] == 4
+        assert [
+            uuid.UUID(bytes=data["columns"]["id"][i : i + 16]) for i in range(0, 64, 16)
+        ] == [
+            first.pk,
+            caries.pk,
+            second.pk,
+            second.get_children()[0].pk,
+        ]
+        assert list(data["columns"]["parent"]) == [-1, 0, -1, 2]
+        assert [data["classes"][code] for code in data["columns"]["class"]] == [
+            "tooth",
+            "caries",
+            "tooth",
+            "caries",
+        ]
+        assert list(data["columns"]["end_x"]) == [10, 5, 10, 5]
+        assert list(data["columns"]["confirmed"]) == [0, 0, 1, 1]
+        assert data["columns"]["confidence"][0] == pytest.approx(0.9)
+        offsets = data["columns"]["tags.offsets"]
+        assert data["columns"]["tags.data"][offsets[2] : offsets[3]] == b"47"
+
+        data = decode(
+            client.get(url, {"format": "columnar", "class_id": "caries"}).content
+        )
+        assert data["count"] == 2
+        assert list(data["columns"]["parent"]) == [-1, -1]
+
+        response = client.get(url, {"format": "columnar", "bbox": "1,2"})
+        assert response.status_code == 400
+        assert "bbox" in response.json()
+
+    @pytest.mark.django_db
+    def test_write_image_annotations_not_columnar(
+        self, client: APIClient, image: Image
+    ):
+        tooth = add_tooth(image, "48")
+        url = f"/api/images/{image.pk}/annotations/"
+        operations = [
+            {"op": "replace", "path": f"/{tooth.pk}", "value": {"tags": ["47"]}}
+        ]
+
+        response = client.patch(
+            url, operations, format="json", HTTP_ACCEPT=ColumnarRenderer.media_type
+        )
+        assert response.status_code == 406
+        response = client.patch(
+            url,
+            operations,
+            format="json",
+            HTTP_ACCEPT=f"{ColumnarRenderer.media_type}, application/json",
+        )
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/json"
+        assert response.json()[0]["tags"] == ["47"]
+        response = client.post(
+            url, [], format="json", HTTP_ACCEPT=ColumnarRenderer.media_type
+        )
+        assert response.status_code == 406
+
+    @pytest.mark.django_db
+    def test_get_image_annotations_stream(self, client: APIClient, image: Image):
+        first = add_tooth(image, "48")
+        add_caries(first)
+        add_tooth(image, "47", confirmed=True)
+
+        response = client.get(f"/api/images/{image.pk}/annotations/", {"stream": "1"})
+
+        assert json.loads(b"".join(response.streaming_content)) == (
+            client.get(f"/api/images/{image.pk}/annotations/").json()
+        )
+
+    @pytest.mark.django_db
+    def test_get_image_annotations_asgi(self, client: APIClient, image: Image):
+        first = add_tooth(image, "48")
+        caries = add_caries(first)
+        add_tooth(image, "47")
+        expected = client.get(f"/api/images/{image.pk}/annotations/").json()
+        expected_detail = client.get(f"/api/annotations/{caries.pk}/").json()
+
+        async def fetch():
+            async_client = AsyncClient()
+            response = await async_client.get(
+                f"/api/images/{image.pk}/annotations/", {"stream": "1"}
+            )
+            streamed = b"".join([part async for part in response.streaming_content])
+            detail = await async_client.get(f"/api/annotations/{caries.pk}/")
+            return streamed, detail
+
+        streamed, detail = async_to_sync(fetch)()
+
+        assert json.loads(streamed) == expected
+        assert detail.status_code == 200
+        assert detail.json() == expected_detail
+        # The detail is cached by the sync request, so the hit needs no query.
+        assert detail["Server-Timing"].startswith('db;desc="0 queries"')
+
+
+class TestAnnotationMoveView:
+    @pytest.mark.django_db
+    def test_move_annotations(
+        self, client: APIClient, image: Image, django_assert_max_num_queries
+    ):
+        first = add_tooth(image, "48")
+        second = add_tooth(image, "47")
+        caries = add_caries(first)
+        other = add_caries(first)
+        nested = add_caries(caries)
+
+        with django_assert_max_num_queries(10):
+            response = client.post(
+                "/api/annotations/move/",
+                [
+                    {"id": str(caries.pk), "parent": str(second.pk)},
+                    {"id": str(other.pk), "parent": str(second.pk)},
+                    {"id": str(nested.pk), "parent": None},
+                ],
+                format="json",
+            )
+
+        assert response.status_code == 200
+        assert [item["id"] for item in response.json()] == [
+            str(caries.pk),
+            str(other.pk),
+            str(nested.pk),
+        ]
+        assert response.json()[0]["relations"][0]["label_id"] == str(second.pk)
+        assert Annotation.find_problems() == ([], [], [], [], [])
+        assert Annotation.objects.get(pk=first.pk).numchild == 0
+        assert {
+            node.pk for node in Annotation.objects.get(pk=second.pk).get_children()
+        } == {
+            caries.pk,
+            other.pk,
+        }
+        nested.refresh_from_db()
+        assert nested.is_root()
+        assert nested.image_id == image.pk
+
+        client.post(
+            "/api/annotations/move/",
+            [
+                {"id": str(second.pk), "parent": str(first.pk)},
+                {"id": str(caries.pk), "parent": str(nested.pk)},
+            ],
+            format="json",
+        )
+        assert Annotation.find_problems() == ([], [], [], [], [])
+        assert [node.pk for node in Annotation.get_tree(first)] == [
+            first.pk,
+            second.pk,
+            other.pk,
+        ]
+        assert Annotation.objects.get(pk=caries.pk).get_parent().pk == nested.pk
+
+    @pytest.mark.django_db
+    def test_move_annotations_rejects_cycles(self, client: APIClient, image: Image):
+        tooth = add_tooth(image, "48")
+        caries = add_caries(tooth)
+
+        response = client.post(
+            "/api/annotations/move/",
+            [{"id": str(tooth.pk), "parent": str(caries.pk)}],
+            format="json",
+        )
+
+        assert response.status_code == 400
+        assert Annotation.objects.get(pk=tooth.pk).is_root()
+
+    @pytest.mark.django_db
+    def test_move_annotations_rejects_full_parents(
+        self, client: APIClient, image: Image
+    ):
+        tooth = add_tooth(image, "48")
+        full = add_caries(tooth)
+        Annotation.objects.filter(pk=full.pk).update(path=f"{tooth.path}ZZZZ")
+        caries = add_caries(add_tooth(image, "47"))
+        payload = {
+            "id": str(uuid.uuid4()),
+            "class_id": "caries",
+            "relations": [{"type": "child", "label_id": str(tooth.pk)}],
+            "shape": {"start_x": 1, "start_y": 1, "end_x": 2, "end_y": 2},
+            "meta": {"confirmed": False, "confidence_percent": 0.8},
+        }
+
+        response = client.post(
+            "/api/annotations/move/",
+            [{"id": str(caries.pk), "parent": str(tooth.pk)}],
+            format="json",
+        )
+        assert response.status_code == 400
+        assert "parent" in response.json()
+
+        for data in (payload, [payload]):
+            response = client.post(
+                f"/api/images/{image.pk}/annotations/", data, format="json"
+            )
+            assert response.status_code == 400
+        assert not Annotation.objects.filter(pk=payload["id"]).exists()
+
+    @pytest.mark.django_db
+    def test_move_annotations_of_deleted_images(self, client: APIClient, image: Image):
+        tooth = add_tooth(image, "48")
+        caries = add_caries(add_tooth(image, "47"))
+        Image.objects.filter(pk=image.pk).update(is_deleted=True)
+
+        response = client.post(
+            "/api/annotations/move/",
+            [{"id": str(caries.pk), "parent": str(tooth.pk)}],
+            format="json",
+        )
+
+        assert response.status_code == 400
+        assert Annotation.objects.get(pk=caries.pk).depth == 2
+
+
+class TestAnnotationPatch:
+    @pytest.mark.django_db
+    def test_patch_annotation(
+        self, client: APIClient, image: Image, django_assert_max_num_queries
+    ):
+        first = add_tooth(image, "48")
+        second = add_tooth(image, "47")
+        caries = add_caries(first)
+        url = f"/api/annotations/{caries.pk}/"
+
+        # Lock, cache invalidation, UPDATE and the parent lookup for the response,
+        # plus the savepoint pair of the nested transaction.
+        with django_assert_max_num_queries(6):
+            response = client.patch(
+                url, {"shape": {"end_x": 7}, "meta": {"confirmed": True}}, format="json"
+            )
+
+        assert response.status_code == 200
+        assert response.json()["shape"] == {
+            "start_x": 2,
+            "start_y": 2,
+            "end_x": 7,
+            "end_y": 5,
+        }
+        caries.refresh_from_db()
+        assert (caries.end_x, caries.confirmed, caries.surface) == (7, True, ["B"])
+
+        response = client.patch(
+            url,
+            {"relations": [{"type": "child", "label_id": str(second.pk)}]},
+            format="json",
+        )
+        assert response.json()["relations"][0]["label_id"] == str(second.pk)
+        assert Annotation.objects.get(pk=caries.pk).get_parent().pk == second.pk
+        assert Annotation.find_problems() == ([], [], [], [], [])
+
+        response = client.patch(url, {"shape": {"end_x": "wide"}}, format="json")
+        assert response.status_code == 400
+        assert "end_x" in response.json()["shape"]
+
+    @pytest.mark.django_db
+    def test_patch_image_annotations(
+        self, client: APIClient, image: Image, django_capture_on_commit_callbacks
+    ):
+        first = add_tooth(image, "48")
+        second = add_tooth(image, "47")
+        caries = add_caries(first)
+        removed = add_caries(second)
+        add_caries(removed)
+        new_id = str(uuid.uuid4())
+        url = f"/api/images/{image.pk}/annotations/"
+        client.get(url)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.patch(
+                url,
+                [
+                    {"op": "remove", "path": f"/{removed.pk}"},
+                    {
+                        "op": "replace",
+                        "path": f"/{first.pk}",
+                        "value": {"tags": ["46"]},
+                    },
+                    {"op": "move", "from": f"/{caries.pk}", "path": f"/{second.pk}"},
+                    {
+                        "op": "add",
+                        "path": f"/{caries.pk}",
+                        "value": {
+                            "id": new_id,
+                            "class_id": "caries",
+                            "shape": {
+                                "start_x": 1,
+                                "start_y": 1,
+                                "end_x": 2,
+                                "end_y": 2,
+                            },
+                            "meta": {"confirmed": False, "confidence_percent": 0.5},
+                        },
+                    },
+                ],
+                format="json",
+            )
+
+        assert response.status_code == 200
+        assert {item["id"] for item in response.json()} == {
+            str(first.pk),
+            str(caries.pk),
+            new_id,
+        }
+        assert Annotation.find_problems() == ([], [], [], [], [])
+        assert Annotation.objects.filter(image=image).count() == 4
+        assert Annotation.objects.get(pk=first.pk).tags == ["46"]
+        assert Annotation.objects.get(pk=first.pk).numchild == 0
+        assert Annotation.objects.get(pk=second.pk).numchild == 1
+        assert [node.pk for node in Annotation.get_tree(second)] == [
+            second.pk,
+            caries.pk,
+            uuid.UUID(new_id),
+        ]
+        tree = client.get(url).json()
+        assert [item["id"] for subtree in tree for item in subtree] == [
+            str(first.pk),
+            str(second.pk),
+            str(caries.pk),
+            new_id,
+        ]
+
+    @pytest.mark.django_db
+    def test_patch_image_annotations_rejects_invalid_operations(
+        self, client: APIClient, image: Image
+    ):
+        tooth = add_tooth(image, "48")
+        other = Image.objects.create(image="images/other.png", width=1, height=1)
+        foreign = add_tooth(other, "11")
+
+        response = client.patch(
+            f"/api/images/{image.pk}/annotations/",
+            [
+                {"op": "remove", "path": f"/{tooth.pk}"},
+                {"op": "replace", "path": f"/{tooth.pk}", "value": {"tags": ["1"]}},
+                {"op": "move", "from": f"/{foreign.pk}", "path": "/"},
+                {"op": "copy", "path": "/"},
+            ],
+            format="json",
+        )
+
+        assert response.status_code == 400
+        errors = response.json()
+        assert errors[0] == {}
+        assert "op" in errors[3]
+        assert Annotation.objects.filter(pk=tooth.pk).exists()
+
+    @pytest.mark.django_db
+    def test_patch_image_annotations_rejects_existing_ids(
+        self, client: APIClient, image: Image
+    ):
+        tooth = add_tooth(image, "48")
+        new_id = str(uuid.uuid4())
+
+        def add(pk):
+            return {
+                "op": "add",
+                "path": "/",
+                "value": {
+                    "id": pk,
+                    "class_id": "tooth",
+                    "shape": {"start_x": 0, "start_y": 0, "end_x": 1, "end_y": 1},
+                    "meta": {"confirmed": False, "confidence_percent": 0.5},
+                },
+            }
+
+        response = client.patch(
+            f"/api/images/{image.pk}/annotations/",
+            [add(str(tooth.pk)), add(new_id), add(new_id)],
+            format="json",
+        )
+
+        assert response.status_code == 400
+        assert response.json() == [
+            {"value": [f"Annotation {tooth.pk} already exists."]},
+            {},
+            {"value": [f"Annotation {new_id} is added by this patch."]},
+        ]
+        assert Annotation.objects.filter(image=image).count() == 1
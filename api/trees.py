@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import operator
+from collections import defaultdict
+from functools import reduce
+from typing import Iterable, Iterator, Optional
+
+from django.db.models import Q, QuerySet
+
+from api.models import Annotation
+from api.streaming import chunked
+
+# Siblings are stored in insertion order, so class ordering is applied on read.
+sibling_order = operator.attrgetter("class_id", "path")
+
+
+class AnnotationTree:
+    def __init__(self, nodes: Iterable[Annotation]) -> None:
+        self.nodes: dict[str, Annotation] = {}
+        self._children: dict[str, list[Annotation]] = defaultdict(list)
+        self._sorted: set[str] = set()
+        for node in nodes:
+            self.nodes[node.path] = node
+            self._children[Annotation._get_parent_path_from_path(node.path)].append(
+                node
+            )
+
+    def __contains__(self, node: Annotation) -> bool:
+        found = self.nodes.get(node.path)
+        return found is not None and found.pk == node.pk
+
+    @classmethod
+    def load(cls, root: Annotation) -> AnnotationTree:
+        query = Q()
+        if not root.is_leaf():
+            query |= Q(path__startswith=root.path, depth__gt=root.depth)
+        if root.depth > 1:
+            query |= Q(path=Annotation._get_parent_path_from_path(root.path))
+        if not query:
+            return cls([root])
+        return cls([root, *Annotation.objects.filter(query).order_by("path")])
+
+    @classmethod
+    def load_forest(cls, roots: Iterable[Annotation]) -> AnnotationTree:
+        roots = list(roots)
+        query = reduce(
+            operator.or_,
+            (
+                Q(path__startswith=root.path, depth__gt=root.depth)
+                for root in roots
+                if not root.is_leaf()
+            ),
+            Q(),
+        )
+        if not query:
+            return cls(roots)
+        return cls([*roots, *Annotation.objects.filter(query).order_by("path")])
+
+    @classmethod
+    def load_image(cls, pk) -> AnnotationTree:
+        return cls(Annotation.objects.live().filter(image_id=pk).order_by("path"))
+
+    @classmethod
+    def with_parents(cls, nodes: Iterable[Annotation]) -> AnnotationTree:
+        nodes = list(nodes)
+        paths = {node.path for node in nodes}
+        parent_paths = (
+            {Annotation._get_parent_path_from_path(node.path) for node in nodes}
+            - paths
+            - {""}
+        )
+        if not parent_paths:
+            return cls(nodes)
+        parents = Annotation.objects.filter(path__in=parent_paths).only("id", "path")
+        return cls([*parents, *nodes])
+
+    @classmethod
+    def iter_forests(
+        cls, roots: QuerySet[Annotation], chunk_size: int
+    ) -> Iterator[AnnotationTree]:
+        for batch in chunked(roots.iterator(chunk_size=chunk_size), chunk_size):
+            yield cls.load_forest(batch)
+
+    def _siblings(self, parent_path: str) -> list[Annotation]:
+        siblings = self._children.get(parent_path, [])
+        if parent_path not in self._sorted:
+            siblings.sort(key=sibling_order)
+            self._sorted.add(parent_path)
+        return siblings
+
+    def get_roots(self) -> list[Annotation]:
+        return self._siblings("")
+
+    def get_children(self, node: Annotation) -> list[Annotation]:
+        return self._siblings(node.path)
+
+    def get_parent(self, node: Annotation) -> Optional[Annotation]:
+        return self.nodes.get(Annotation._get_parent_path_from_path(node.path))
+
+    def iter_subtree(self, node: Annotation) -> Iterator[Annotation]:
+        yield node
+        for child in self.get_children(node):
+            yield from self.iter_subtree(child)
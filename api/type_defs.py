@@ -49,6 +49,35 @@ class AnnotationFlatDict(TypedDict):
     parent: NotRequired[str]
 
 
+class ShapePatch(TypedDict, total=False):
+    start_x: int
+    start_y: int
+    end_x: int
+    end_y: int
+
+
+class MetaPatch(TypedDict, total=False):
+    confirmed: bool
+    confidence_percent: float
+
+
+class AnnotationPatchDict(TypedDict, total=False):
+    class_id: Literal["tooth", "caries"]
+    shape: ShapePatch
+    relations: list[Relation]
+    tags: Optional[list[str]]
+    surface: Optional[list[str]]
+    meta: MetaPatch
+
+
+class ImageRecordDict(TypedDict):
+    id: NotRequired[str]
+    file_name: str
+    width: int
+    height: int
+    created_at: NotRequired[str]
+
+
 class AnnotationExternalDict(TypedDict):
     kind: Literal["tooth", "caries"]
     shape: ShapeExternal
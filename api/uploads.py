@@ -0,0 +1,123 @@
+import hashlib
+import struct
+from typing import IO, Optional
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image as PILImage
+
+HEADER_SIZE = 64 * 1024
+
+JPEG_SOF_MARKERS = {
+    0xC0,
+    0xC1,
+    0xC2,
+    0xC3,
+    0xC5,
+    0xC6,
+    0xC7,
+    0xC9,
+    0xCA,
+    0xCB,
+    0xCD,
+    0xCE,
+    0xCF,
+}
+
+
+def _jpeg_size(header: bytes) -> Optional[tuple[int, int]]:
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", header[i + 5 : i + 9])
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            i += 2
+            continue
+        i += 2 + struct.unpack(">H", header[i + 2 : i + 4])[0]
+    return None
+
+
+def _webp_size(header: bytes) -> Optional[tuple[int, int]]:
+    chunk = header[12:16]
+    if chunk == b"VP8X" and len(header) >= 30:
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8L" and len(header) >= 25:
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 " and len(header) >= 30:
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    return None
+
+
+def parse_image_size(header: bytes) -> Optional[tuple[int, int]]:
+    if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+        return struct.unpack(">II", header[16:24])
+    if header[:6] in (b"GIF87a", b"GIF89a") and len(header) >= 10:
+        return struct.unpack("<HH", header[6:10])
+    if header.startswith(b"\xff\xd8"):
+        return _jpeg_size(header)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return _webp_size(header)
+    if header[:2] == b"BM" and len(header) >= 26:
+        if struct.unpack("<I", header[14:18])[0] == 12:
+            return struct.unpack("<HH", header[18:22])
+        width, height = struct.unpack("<ii", header[18:26])
+        return width, abs(height)
+    return None
+
+
+def probe_image_size(file: IO[bytes]) -> tuple[Optional[int], Optional[int]]:
+    cached = getattr(file, "image_size", None)
+    if cached is None and getattr(file, "_file", None) is not None:
+        cached = getattr(file._file, "image_size", None)
+    if cached is not None:
+        return cached
+
+    close = file.closed
+    file.open()
+    try:
+        file.seek(0)
+        size = parse_image_size(file.read(HEADER_SIZE))
+        if size is None:
+            file.seek(0)
+            try:
+                with PILImage.open(file) as image:
+                    size = image.size
+            except Exception:
+                return None, None
+        file.seek(0)
+    finally:
+        if close:
+            file.close()
+    file.image_size = size
+    return size
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs) -> None:
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.header = b""
+
+    def receive_data_chunk(self, raw_data: bytes, start: int) -> None:
+        self.hasher.update(raw_data)
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[: HEADER_SIZE - len(self.header)]
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size: int):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        size = parse_image_size(self.header)
+        if size is not None:
+            file.image_size = size
+        return file
@@ -0,0 +1,333 @@
+import re
+import uuid
+from types import NoneType, UnionType
+from typing import (
+    Any,
+    Callable,
+    Literal,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+    is_typeddict,
+)
+
+from django.contrib.postgres.fields import ArrayField
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection, models
+from rest_framework import fields, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
+
+from api.models import Annotation, Image
+from api.type_defs import (
+    AnnotationDict,
+    AnnotationFlatDict,
+    AnnotationPatchDict,
+    ImageRecordDict,
+    Relation,
+)
+
+Validator = Callable[[Any], Any]
+
+INTEGER_RE = re.compile(r"^\s*[-+]?\d+(\.0*)?\s*$")
+MISSING = object()
+
+
+class Invalid(Exception):
+    def __init__(self, detail: Any) -> None:
+        self.detail = detail
+
+
+def _message(field: type[fields.Field], key: str, **kwargs: Any) -> str:
+    return str(field.default_error_messages[key]).format(**kwargs)
+
+
+def _integer(min_value: int, max_value: int) -> Validator:
+    def validate(value: Any) -> int:
+        if type(value) is not int:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            elif isinstance(value, str) and INTEGER_RE.match(value):
+                value = int(float(value))
+            else:
+                raise Invalid([_message(fields.IntegerField, "invalid")])
+        if value > max_value:
+            raise Invalid(
+                [_message(fields.IntegerField, "max_value", max_value=max_value)]
+            )
+        if value < min_value:
+            raise Invalid(
+                [_message(fields.IntegerField, "min_value", min_value=min_value)]
+            )
+        return value
+
+    return validate
+
+
+def _float(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    raise Invalid([_message(fields.FloatField, "invalid")])
+
+
+def _boolean(value: Any) -> bool:
+    try:
+        if value in fields.BooleanField.TRUE_VALUES:
+            return True
+        if value in fields.BooleanField.FALSE_VALUES:
+            return False
+    except TypeError:
+        pass
+    raise Invalid([_message(fields.BooleanField, "invalid")])
+
+
+def _string(max_length: int | None) -> Validator:
+    def validate(value: Any) -> str:
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise Invalid([_message(fields.CharField, "invalid")])
+        value = str(value).strip()
+        if not value:
+            raise Invalid([_message(fields.CharField, "blank")])
+        if max_length is not None and len(value) > max_length:
+            raise Invalid(
+                [_message(fields.CharField, "max_length", max_length=max_length)]
+            )
+        return value
+
+    return validate
+
+
+def _uuid(value: Any) -> uuid.UUID:
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except (ValueError, AttributeError):
+        raise Invalid([_message(fields.UUIDField, "invalid", value=value)])
+
+
+def _choice(choices: tuple[str, ...]) -> Validator:
+    allowed = frozenset(choices)
+
+    def validate(value: Any) -> str:
+        if isinstance(value, str) and value in allowed:
+            return value
+        raise Invalid([_message(fields.ChoiceField, "invalid_choice", input=value)])
+
+    return validate
+
+
+def _nullable(validate: Validator) -> Validator:
+    def nullable(value: Any) -> Any:
+        return None if value is None else validate(value)
+
+    return nullable
+
+
+def _list(child: Validator) -> Validator:
+    def validate(value: Any) -> list:
+        if not isinstance(value, list):
+            raise Invalid(
+                [
+                    _message(
+                        fields.ListField, "not_a_list", input_type=type(value).__name__
+                    )
+                ]
+            )
+        result, errors = [], {}
+        for index, item in enumerate(value):
+            try:
+                result.append(child(item))
+            except Invalid as error:
+                errors[index] = error.detail
+        if errors:
+            raise Invalid(errors)
+        return result
+
+    return validate
+
+
+def _dict(validators: dict[str, tuple[Validator, bool]]) -> Validator:
+    required_message = [_message(fields.Field, "required")]
+
+    def validate(value: Any) -> dict:
+        if not isinstance(value, dict):
+            raise Invalid(
+                {
+                    api_settings.NON_FIELD_ERRORS_KEY: [
+                        _message(
+                            serializers.Serializer,
+                            "invalid",
+                            datatype=type(value).__name__,
+                        )
+                    ]
+                }
+            )
+        result, errors = {}, {}
+        for key, (child, required) in validators.items():
+            item = value.get(key, MISSING)
+            if item is MISSING:
+                if required:
+                    errors[key] = required_message
+                continue
+            try:
+                result[key] = child(item)
+            except Invalid as error:
+                errors[key] = error.detail
+        if errors:
+            raise Invalid(errors)
+        return result
+
+    return validate
+
+
+def _model_validator(field: models.Field) -> Validator | None:
+    if isinstance(field, models.ForeignKey):
+        field = field.target_field
+    if isinstance(field, models.UUIDField):
+        return _uuid
+    if isinstance(field, models.IntegerField):
+        return _integer(*connection.ops.integer_field_range(field.get_internal_type()))
+    if isinstance(field, ArrayField):
+        return _list(_string(field.base_field.max_length))
+    if isinstance(field, models.CharField) and not field.choices:
+        return _string(field.max_length)
+    return None
+
+
+def compile_validator(
+    annotation: Any,
+    model: type[models.Model] | None = None,
+    overrides: dict[type, dict[str, Validator]] | None = None,
+) -> Validator:
+    overrides = overrides or {}
+    origin, args = get_origin(annotation), get_args(annotation)
+    if origin in (Union, UnionType) and NoneType in args:
+        (inner,) = [arg for arg in args if arg is not NoneType]
+        return _nullable(compile_validator(inner, model, overrides))
+    if origin is Literal:
+        return _choice(args)
+    if origin is list:
+        return _list(compile_validator(args[0], model, overrides))
+    if is_typeddict(annotation):
+        validators = {}
+        for key, hint in get_type_hints(annotation).items():
+            validate = overrides.get(annotation, {}).get(key)
+            if validate is None and model is not None:
+                try:
+                    validate = _model_validator(model._meta.get_field(key))
+                except FieldDoesNotExist:
+                    pass
+            if validate is None:
+                validate = compile_validator(hint, model, overrides)
+            elif get_origin(hint) in (Union, UnionType):
+                validate = _nullable(validate)
+            required = key in annotation.__required_keys__ and not (
+                get_origin(hint) in (Union, UnionType) and NoneType in get_args(hint)
+            )
+            validators[key] = (validate, required)
+        return _dict(validators)
+    if annotation is bool:
+        return _boolean
+    if annotation is int:
+        return _integer(*connection.ops.integer_field_range("IntegerField"))
+    if annotation is float:
+        return _float
+    if annotation is str:
+        return _string(None)
+    raise TypeError(f"Cannot compile a validator for {annotation!r}")
+
+
+validate_annotation_dict = compile_validator(
+    AnnotationDict, Annotation, overrides={Relation: {"label_id": _uuid}}
+)
+validate_annotation_patch_dict = compile_validator(
+    AnnotationPatchDict, Annotation, overrides={Relation: {"label_id": _uuid}}
+)
+validate_image_record = compile_validator(ImageRecordDict, Image)
+
+
+def _flatten(data: dict) -> AnnotationFlatDict:
+    shape, meta, relations = data["shape"], data["meta"], data.get("relations")
+    flat = {
+        "id": data["id"],
+        "image": data.get("image"),
+        "class_id": data["class_id"],
+        "start_x": shape["start_x"],
+        "start_y": shape["start_y"],
+        "end_x": shape["end_x"],
+        "end_y": shape["end_y"],
+        "confirmed": meta["confirmed"],
+        "confidence_percent": meta["confidence_percent"],
+        "tags": data.get("tags"),
+        "surface": data.get("surface"),
+        "parent": relations[0]["label_id"] if relations else None,
+    }
+    return {key: value for key, value in flat.items() if value is not None}
+
+
+def _flatten_patch(data: AnnotationPatchDict) -> dict:
+    flat = {**data.get("shape", {}), **data.get("meta", {})}
+    for key in ("class_id", "tags", "surface"):
+        if key in data:
+            flat[key] = data[key]
+    if "relations" in data:
+        flat["parent"] = data["relations"][0]["label_id"] if data["relations"] else None
+    return flat
+
+
+def flatten_annotations(
+    items: list[AnnotationDict],
+) -> tuple[list[AnnotationFlatDict], list[dict]]:
+    validated: list[AnnotationFlatDict] = []
+    errors: list[dict] = []
+    for item in items:
+        try:
+            validated.append(_flatten(validate_annotation_dict(item)))
+            errors.append({})
+        except Invalid as error:
+            validated.append({})
+            errors.append(error.detail)
+    return validated, errors
+
+
+def validate_annotations(items: list[AnnotationDict]) -> list[AnnotationFlatDict]:
+    validated, errors = flatten_annotations(items)
+
+    # Images are resolved for the whole batch at once instead of one query per
+    # item as PrimaryKeyRelatedField would do.
+    image_ids = {item["image"] for item in validated if "image" in item}
+    images = Image.objects.in_bulk(image_ids) if image_ids else {}
+    does_not_exist = str(
+        PrimaryKeyRelatedField.default_error_messages["does_not_exist"]
+    )
+    for index, item in enumerate(validated):
+        if "image" not in item:
+            continue
+        if item["image"] not in images:
+            errors[index] = {"image": [does_not_exist.format(pk_value=item["image"])]}
+        item["image"] = images.get(item["image"])
+
+    if any(errors):
+        raise serializers.ValidationError(errors)
+    return validated
+
+
+def validate_annotation(item: AnnotationDict) -> AnnotationFlatDict:
+    try:
+        return validate_annotations([item])[0]
+    except serializers.ValidationError as error:
+        raise serializers.ValidationError(error.detail[0])
+
+
+def validate_annotation_patch(data: AnnotationPatchDict) -> dict:
+    try:
+        return _flatten_patch(validate_annotation_patch_dict(data))
+    except Invalid as error:
+        raise serializers.ValidationError(error.detail)
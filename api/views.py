@@ -1,24 +1,221 @@
-from django.shortcuts import get_object_or_404
-from rest_framework import viewsets
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.db import transaction
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from api.async_views import AsyncAPIView
+from api.bulk import bulk_move
+from api.cache import annotation_cache, image_scope, invalidate_image, tree_scope
+from api.columnar import to_columns
+from api.derivatives import (
+    manifest_name,
+    schedule_derivatives,
+    thumbnail_name,
+    tile_name,
+)
+from api.filters import filter_annotations, is_filtered
+from api.metrics import render_metrics
 from api.models import Image, Annotation
-from api.serializers import ImageSerializer, AnnotationSerializer
+from api.pagination import KeysetPagination
+from api.patch import apply_patch, patch_annotation
+from api.renderers import ColumnarRenderer
+from api.routers import ReplicaReadsMixin
+from api.serializers import (
+    AnnotationMoveSerializer,
+    AnnotationSerializer,
+    ImageSerializer,
+)
+from api.serving import serve_file
+from api.streaming import (
+    STREAM_CHUNK_SIZE,
+    chunked,
+    is_asgi,
+    streaming_json_response,
+    wants_stream,
+)
+from api.trees import AnnotationTree
+from api.uploads import HashingUploadHandler
+from api.validation import validate_annotation_patch
 
 
-class ImageViewSet(viewsets.ModelViewSet):
+class ImageViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
+    pagination_class = KeysetPagination
+
+    def initial(self, request, *args, **kwargs):
+        request.upload_handlers = [HashingUploadHandler(request)]
+        super().initial(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if wants_stream(request):
+            queryset = self.filter_queryset(self.get_queryset()).order_by(
+                *KeysetPagination.ordering
+            )
+            return streaming_json_response(
+                (
+                    self.get_serializer(image).data
+                    for image in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE)
+                ),
+                is_asgi(request),
+            )
+        return super().list(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        self._schedule_derivatives(serializer.save())
+
+    def perform_update(self, serializer):
+        blob_id = serializer.instance.blob_id
+        instance = serializer.save()
+        if instance.blob_id != blob_id:
+            self._schedule_derivatives(instance)
+
+    def _schedule_derivatives(self, instance: Image):
+        # Shared blobs already have derivatives unless an earlier render failed.
+        name = instance.image.name
+        if instance.blob.refcount == 1 or not default_storage.exists(
+            manifest_name(name)
+        ):
+            transaction.on_commit(lambda: schedule_derivatives(name))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        invalidate_image(instance.pk)
+        instance.is_deleted = True
+        instance.save(update_fields=["is_deleted", "updated_at"])
+
+    @action(detail=True)
+    def file(self, request, pk=None):
+        image = self.get_object()
+        return serve_file(request, image.image.name, image.updated_at)
+
+    @action(detail=True)
+    def thumbnail(self, request, pk=None):
+        image = self.get_object()
+        return self._derivative_response(image, thumbnail_name(image.image.name))
+
+    @action(detail=True)
+    def tiles(self, request, pk=None):
+        name = manifest_name(self.get_object().image.name)
+        if not default_storage.exists(name):
+            raise NotFound("Tiles have not been generated yet.")
+        with default_storage.open(name) as file:
+            return Response(json.load(file))
+
+    @action(detail=True, url_path=r"tiles/(?P<level>\d+)/(?P<col>\d+)_(?P<row>\d+)")
+    def tile(self, request, pk=None, level=None, col=None, row=None):
+        image = self.get_object()
+        return self._derivative_response(
+            image, tile_name(image.image.name, level, col, row)
+        )
+
+    def _derivative_response(self, image: Image, name: str):
+        if not default_storage.exists(name):
+            raise NotFound("Derivative has not been generated yet.")
+        return serve_file(self.request, name, image.updated_at)
+
+
+class ImageAnnotationView(ReplicaReadsMixin, AsyncAPIView):
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarRenderer]
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.request.method in ("GET", "HEAD"):
+            return renderers
+        # Writes respond with serializer output, which has no columnar encoding.
+        return [
+            renderer
+            for renderer in renderers
+            if not isinstance(renderer, ColumnarRenderer)
+        ]
 
+    async def get(self, request, pk, format=None):
+        if isinstance(request.accepted_renderer, ColumnarRenderer):
+            return Response(
+                await annotation_cache.aget_or_set(
+                    image_scope(pk),
+                    f"columnar:{request.query_params.urlencode()}",
+                    lambda: to_columns(self._nodes(request, pk)),
+                )
+            )
+        if wants_stream(request):
+            asynchronous = is_asgi(request)
+            if is_filtered(request.query_params):
+                annotations = filter_annotations(
+                    Annotation.objects.live().filter(image_id=pk), request.query_params
+                )
+                return streaming_json_response(
+                    self._iter_flat(annotations), asynchronous
+                )
+            roots = (
+                Annotation.objects.live()
+                .filter(image_id=pk, depth=1)
+                .order_by("class_id", "path")
+            )
+            return streaming_json_response(self._iter_trees(roots), asynchronous)
+        return Response(
+            await annotation_cache.aget_or_set(
+                image_scope(pk),
+                request.query_params.urlencode(),
+                lambda: self._represent(request, pk),
+            )
+        )
 
-class ImageAnnotationView(APIView):
-    def get(self, request, pk, format=None):
-        annotation = Annotation.objects.filter(image_id=pk)
-        serializer = AnnotationSerializer(annotation, many=True)
-        return Response(serializer.data)
+    def _represent(self, request, pk):
+        if is_filtered(request.query_params):
+            annotations = filter_annotations(
+                Annotation.objects.live().filter(image_id=pk), request.query_params
+            )
+            return AnnotationSerializer().to_flat_representation(annotations)
+        tree = AnnotationTree.load_image(pk)
+        serializer = AnnotationSerializer(
+            tree.get_roots(), many=True, context={"tree": tree}
+        )
+        return serializer.data
 
-    def post(self, request, pk, format=None):
+    def _nodes(self, request, pk) -> list[Annotation]:
+        if is_filtered(request.query_params):
+            return list(
+                filter_annotations(
+                    Annotation.objects.live().filter(image_id=pk), request.query_params
+                )
+            )
+        tree = AnnotationTree.load_image(pk)
+        return [node for root in tree.get_roots() for node in tree.iter_subtree(root)]
+
+    def _iter_flat(self, annotations):
+        for chunk in chunked(
+            annotations.iterator(chunk_size=STREAM_CHUNK_SIZE), STREAM_CHUNK_SIZE
+        ):
+            yield from AnnotationSerializer().to_flat_representation(chunk)
+
+    def _iter_trees(self, roots):
+        for tree in AnnotationTree.iter_forests(roots, STREAM_CHUNK_SIZE):
+            serializer = AnnotationSerializer(context={"tree": tree})
+            for root in tree.get_roots():
+                yield serializer.to_representation(root)
+
+    async def post(self, request, pk, format=None):
+        return await sync_to_async(self._create)(request, pk)
+
+    async def patch(self, request, pk, format=None):
+        return await sync_to_async(self._patch)(request, pk)
+
+    def _patch(self, request, pk):
+        image = get_object_or_404(Image, pk=pk)
+        annotations = apply_patch(image, request.data)
+        return Response(AnnotationSerializer().to_flat_representation(annotations))
+
+    def _create(self, request, pk):
         image = get_object_or_404(Image, pk=pk)
         data = request.data
         if isinstance(data, list):
@@ -35,16 +232,54 @@ class ImageAnnotationView(APIView):
         return Response(serializer.errors)
 
 
-class AnnotationDetailView(APIView):
-    def get(self, request, pk, format=None):
-        annotation = Annotation.objects.get(pk=pk)
-        serializer = AnnotationSerializer(annotation)
-        return Response(serializer.data)
+class AnnotationDetailView(ReplicaReadsMixin, AsyncAPIView):
+    async def get(self, request, pk, format=None):
+        key = str(pk)
+        scope = await annotation_cache.ascope(key)
+        if scope is not None:
+            data = await annotation_cache.aget(scope, key)
+            if data is not None:
+                return Response(data)
+        annotation = await aget_object_or_404(Annotation.objects.live(), pk=pk)
+        scope = tree_scope(annotation.path)
+        await annotation_cache.aset_scope(key, scope)
+        return Response(
+            await annotation_cache.aget_or_set(
+                scope, key, lambda: AnnotationSerializer(annotation).data
+            )
+        )
+
+    async def put(self, request, pk, format=None):
+        return await sync_to_async(self._update)(request, pk)
 
-    def put(self, request, pk, format=None):
-        annotation = Annotation.objects.get(pk=pk)
+    async def patch(self, request, pk, format=None):
+        return await sync_to_async(self._patch)(request, pk)
+
+    def _update(self, request, pk):
+        annotation = get_object_or_404(Annotation.objects.live(), pk=pk)
         serializer = AnnotationSerializer(annotation, data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors)
+
+    def _patch(self, request, pk):
+        annotation = patch_annotation(pk, validate_annotation_patch(request.data))
+        return Response(AnnotationSerializer().to_flat_representation([annotation])[0])
+
+
+class AnnotationMoveView(ReplicaReadsMixin, APIView):
+    def post(self, request, format=None):
+        serializer = AnnotationMoveSerializer(data=request.data, many=True)
+        if serializer.is_valid():
+            moved = bulk_move(
+                [(item["id"], item["parent"]) for item in serializer.validated_data]
+            )
+            return Response(AnnotationSerializer().to_flat_representation(moved))
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def metrics(request):
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -86,6 +88,36 @@ DATABASES = {
     }
 }
 
+# Connections come from a per-process psycopg_pool pool instead of being opened per
+# request. Connections are returned to the pool when a request finishes, so this
+# also works under ASGI, where every request runs its queries on a new thread.
+DATABASES["default"]["OPTIONS"] = {
+    "pool": {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 20)),
+    }
+}
+
+# Read replicas
+# Each host in the comma-separated DB_REPLICA_HOSTS becomes a "replicaN" alias with the
+# primary's credentials. Safe requests on the image and annotation views read from a
+# random replica, and clients that wrote within REPLICA_STICKY_SECONDS read from the
+# primary. In tests the replicas mirror the primary's test database.
+
+REPLICA_HOSTS = [
+    host.strip() for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if host
+]
+DATABASE_REPLICAS = [f"replica{i}" for i in range(1, len(REPLICA_HOSTS) + 1)]
+for alias, host in zip(DATABASE_REPLICAS, REPLICA_HOSTS):
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["api.routers.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -123,6 +155,48 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+
+# Image derivatives (thumbnails and tile pyramids)
+# Number of worker processes rendering derivatives; 0 renders them inline.
+
+IMAGE_DERIVATIVE_WORKERS = 2
+
+
+# Image file serving
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) hand the file over to
+# the web server; None streams it from Django. IMAGE_SENDFILE_ROOT is the internal
+# nginx location that aliases the media root.
+
+IMAGE_SENDFILE_BACKEND = None
+IMAGE_SENDFILE_ROOT = "/protected/"
+
+
+# Annotation response cache
+# Serialized trees are kept in a per-process LRU of ANNOTATION_CACHE_LOCAL_SIZE entries
+# in front of the shared ANNOTATION_CACHE_ALIAS backend, which also holds the version
+# counters. Point the alias at a memcached/redis cache when running several workers.
+
+ANNOTATION_CACHE_ALIAS = "default"
+ANNOTATION_CACHE_LOCAL_SIZE = 1024
+ANNOTATION_CACHE_TIMEOUT = 60 * 60
+
+
+# Django REST framework
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+
+# Image purge
+# Soft-deleted images are removed by `manage.py purge_deleted`; annotation rows are
+# deleted IMAGE_PURGE_BATCH_SIZE at a time so no statement holds locks for long.
+
+IMAGE_PURGE_BATCH_SIZE = 1000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
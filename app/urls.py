@@ -21,8 +21,14 @@ from api import views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", views.metrics, name="metrics"),
     path("api/images/", views.ImageViewSet.as_view({"get": "list", "post": "create"})),
     path("api/images/<str:pk>/", views.ImageViewSet.as_view({"get": "retrieve", "delete": "destroy", "put": "update"})),
     path("api/images/<str:pk>/annotations/", views.ImageAnnotationView.as_view()),
+    path("api/images/<str:pk>/file/", views.ImageViewSet.as_view({"get": "file"})),
+    path("api/images/<str:pk>/thumbnail/", views.ImageViewSet.as_view({"get": "thumbnail"})),
+    path("api/images/<str:pk>/tiles/", views.ImageViewSet.as_view({"get": "tiles"})),
+    path("api/images/<str:pk>/tiles/<int:level>/<int:col>_<int:row>/", views.ImageViewSet.as_view({"get": "tile"})),
+    path("api/annotations/move/", views.AnnotationMoveView.as_view()),
     path("api/annotations/<str:pk>/", views.AnnotationDetailView.as_view()),
 ]